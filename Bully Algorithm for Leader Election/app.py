@@ -1,20 +1,65 @@
 import fastapi
 import requests
 import os
+import sys
 import uvicorn
 import threading
 import time
 from typing import List, Optional
 
+# Permite importar o pacote common/ da raiz do repositório ao rodar localmente
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.metrics import Registry, log
+from common.transport import Transport
+
 app = fastapi.FastAPI()
+# Conexões keep-alive reutilizadas entre as mensagens para os outros processos
+transport = Transport()
+# Contadores e histogramas expostos em /metrics
+metrics = Registry()
 
 # --- Estado Global ---
 process_id = int(os.getenv("PROCESS_ID", "0"))
 all_processes = [1, 2, 3] # IDs de todos os processos no sistema
 leader_id: Optional[int] = None
+# Termo em que leader_id foi reconhecido (o desempate por ID só vale dentro dele)
+leader_term = 0
 is_election_happening = False
+election_started_at = 0.0
+# Termo (época) da eleição: cresce monotonicamente e ordena os anúncios de líder
+current_term = 0
+# Instante (epoch em segundos) em que a concessão (lease) do líder atual expira
+lease_expiry: Optional[float] = None
+# Duração da concessão do líder e intervalo de renovação pelo próprio líder
+LEASE_DURATION = float(os.getenv("LEASE_DURATION", "15"))
+LEASE_RENEW_INTERVAL = LEASE_DURATION / 3
+# Intervalo entre verificações de saúde do líder
+HEALTHCHECK_INTERVAL = float(os.getenv("HEALTHCHECK_INTERVAL", "10"))
+# Quantidade de eleições iniciadas por este processo (usada para medir eleições duplicadas)
+elections_started = 0
+# Sinaliza às threads de background que o processo está encerrando
+stop_event = threading.Event()
 # Um lock para evitar condições de corrida ao modificar estados compartilhados
-state_lock = threading.Lock()
+state_lock = metrics.lock("state_lock")
+
+# --- Métricas ---
+election_counter = metrics.counter("elections_started_total", "Eleições iniciadas por este processo")
+election_duration = metrics.histogram("election_duration_seconds",
+                                      "Tempo entre o início de uma eleição e o reconhecimento de um líder")
+elections_abandoned = metrics.counter("elections_abandoned_total", "Eleições abandonadas sem anúncio de líder")
+coordinator_messages = metrics.counter("coordinator_messages_total", "Anúncios de líder recebidos")
+stale_announcements = metrics.counter("stale_announcements_total", "Anúncios de líder rejeitados por serem obsoletos")
+stale_elections = metrics.counter("stale_elections_total", "Mensagens de eleição rejeitadas por serem de termos antigos")
+
+def leader_failure_counter(reason: str):
+    return metrics.counter("leader_failures_total", "Falhas do líder detectadas", reason=reason)
+
+def finish_election():
+    """Encerra a eleição em andamento, registrando sua duração. Requer state_lock."""
+    global is_election_happening
+    if is_election_happening:
+        election_duration.observe(time.time() - election_started_at)
+    is_election_happening = False
 
 # --- Funções Auxiliares do Algoritmo ---
 
@@ -22,34 +67,78 @@ def get_higher_processes() -> List[int]:
     """Retorna uma lista de IDs de processos maiores que o atual."""
     return [p for p in all_processes if p > process_id]
 
-def announce_leader():
-    """Anuncia para todos os outros processos que este se tornou o líder."""
-    global leader_id, is_election_happening
+def send_to_process(p_id: int, path: str, payload: Optional[dict] = None, timeout: float = 1):
+    """Envia uma requisição a outro processo: POST com JSON se houver payload, senão GET."""
+    url = f"http://app-{p_id}:8000{path}"
+    if payload is None:
+        return transport.get(url, timeout=timeout)
+    return transport.post(url, json=payload, timeout=timeout)
+
+def lease_is_valid() -> bool:
+    """Retorna True se a concessão do líder conhecido ainda não expirou."""
+    return leader_id is not None and lease_expiry is not None and time.time() < lease_expiry
+
+def announce_leader(renewal: bool = False):
+    """
+    Anuncia para todos os outros processos que este se tornou o líder.
+    Também é usada pelo líder para renovar periodicamente sua concessão (renewal=True).
+    """
+    global leader_id, leader_term, lease_expiry, current_term
     with state_lock:
-        print(f"Processo {process_id} se autoproclamando LÍDER.")
+        if renewal and leader_id != process_id:
+            # Perdeu a liderança para um termo maior enquanto aguardava a renovação
+            return
+        if not renewal:
+            log(f"Processo {process_id} se autoproclamando LÍDER (termo {current_term}).")
         leader_id = process_id
-        is_election_happening = False
+        leader_term = current_term
+        finish_election()
+        lease_expiry = time.time() + LEASE_DURATION
+        payload = {"leader_id": process_id, "term": current_term, "lease_duration": LEASE_DURATION}
 
+    stale = False
+    newest_term = 0
     # Envia mensagem de coordenação para todos os outros processos
     for p_id in all_processes:
         if p_id != process_id:
             try:
-                url = f"http://app-{p_id}:8000/coordinator"
-                requests.post(url, json={"leader_id": process_id}, timeout=0.5)
-                print(f"Processo {process_id} anunciou liderança para {p_id}.")
+                response = send_to_process(p_id, "/coordinator", payload, timeout=0.5)
+                if response.json().get("status") == "STALE":
+                    stale = True
+                    newest_term = max(newest_term, response.json().get("term", 0))
+                    continue
+                if not renewal:
+                    log(f"Processo {process_id} anunciou liderança para {p_id}.")
             except requests.RequestException:
-                print(f"AVISO: Falha ao anunciar liderança para o processo {p_id}.")
+                log(f"AVISO: Falha ao anunciar liderança para o processo {p_id}.")
+
+    if stale:
+        # O anúncio pertence a um termo já superado (ex.: processo reiniciado).
+        # Adota o termo mais recente e disputa uma nova eleição.
+        log(f"Processo {process_id}: anúncio do termo {payload['term']} rejeitado. Iniciando nova eleição.")
+        with state_lock:
+            if leader_id == process_id:
+                leader_id = None
+                lease_expiry = None
+            current_term = max(current_term, newest_term)
+        start_election()
 
 def start_election():
     """Inicia um processo de eleição."""
-    global is_election_happening
+    global is_election_happening, current_term, election_started_at, elections_started
     
     with state_lock:
         if is_election_happening:
-            print(f"Processo {process_id} já está em uma eleição. Ignorando nova tentativa.")
+            log(f"Processo {process_id} já está em uma eleição. Ignorando nova tentativa.")
             return
-        print(f"Processo {process_id} INICIOU UMA ELEIÇÃO.")
+        # Cada eleição abre um novo termo; anúncios de termos anteriores passam a ser ignorados
+        current_term += 1
+        election_term = current_term
+        log(f"Processo {process_id} INICIOU UMA ELEIÇÃO (termo {election_term}).")
         is_election_happening = True
+        election_started_at = time.time()
+        elections_started += 1
+        election_counter.inc()
 
     higher_processes = get_higher_processes()
     if not higher_processes:
@@ -61,29 +150,45 @@ def start_election():
     responses_from_higher = 0
     for p_id in higher_processes:
         try:
-            url = f"http://app-{p_id}:8000/election"
-            requests.post(url, json={"sender_id": process_id}, timeout=1)
+            response = send_to_process(p_id, "/election", {"sender_id": process_id, "term": election_term}, timeout=1)
             # Se a requisição foi bem-sucedida, significa que um processo maior está ativo.
             responses_from_higher += 1
-            print(f"Processo {process_id} enviou msg de eleição para {p_id} e recebeu resposta.")
+            log(f"Processo {process_id} enviou msg de eleição para {p_id} e recebeu resposta.")
+            if response.json().get("status") == "STALE":
+                # O termo desta eleição já foi superado: adota o mais recente e aguarda o anúncio
+                with state_lock:
+                    current_term = max(current_term, response.json().get("term", 0))
         except requests.RequestException:
             # O processo com ID maior provavelmente está inativo.
-            print(f"Processo {process_id} não obteve resposta de eleição do processo {p_id}.")
+            log(f"Processo {process_id} não obteve resposta de eleição do processo {p_id}.")
 
     # Se nenhum processo superior respondeu, este processo se torna o líder.
     if responses_from_higher == 0:
         announce_leader()
     else:
         # Um processo superior assumiu. Apenas aguarda o anúncio do novo líder.
-        print(f"Processo {process_id} aguardando anúncio do novo líder...")
+        log(f"Processo {process_id} aguardando anúncio do novo líder...")
 
 # --- Endpoints da API ---
 
 @app.post("/election")
 def handle_election_message(data: dict):
     """Recebe uma mensagem de eleição de um processo com ID menor."""
+    global current_term
     sender_id = data.get("sender_id")
-    print(f"Processo {process_id} recebeu mensagem de eleição de {sender_id}.")
+    term = data.get("term", 0)
+    log(f"Processo {process_id} recebeu mensagem de eleição de {sender_id} (termo {term}).")
+
+    with state_lock:
+        if term < current_term:
+            # Mensagem de uma eleição já superada (ex.: atrasada na rede): não dispara
+            # nova eleição, apenas informa o termo atual. A resposta ainda indica ao
+            # remetente que um processo maior está ativo.
+            log(f"Processo {process_id} rejeitou mensagem de eleição obsoleta de {sender_id} (termo {term}, atual {current_term}).")
+            stale_elections.inc()
+            return {"status": "STALE", "term": current_term}
+        # Adota o termo do remetente para que a própria eleição use um termo pelo menos tão novo
+        current_term = term
     
     # Responde ao remetente (a própria resposta HTTP 200 OK serve como "resposta")
     # e inicia sua própria eleição, pois tem um ID maior.
@@ -94,21 +199,47 @@ def handle_election_message(data: dict):
 @app.post("/coordinator")
 def handle_coordinator_message(data: dict):
     """Recebe uma mensagem anunciando o novo líder."""
-    global leader_id, is_election_happening
+    global leader_id, leader_term, current_term, lease_expiry
     new_leader_id = data.get("leader_id")
+    term = data.get("term", 0)
+    if not isinstance(new_leader_id, int) or not isinstance(term, int):
+        raise fastapi.HTTPException(status_code=400, detail="Anúncio de líder sem leader_id ou term inteiros.")
     
+    coordinator_messages.inc()
     with state_lock:
+        # Rejeita anúncios de termos antigos e, no mesmo termo, de líderes com ID menor
+        # que o já reconhecido nesse termo (um líder de termo anterior não conta)
+        if term < current_term or (term == leader_term and leader_id is not None
+                                   and new_leader_id < leader_id):
+            log(f"Processo {process_id} rejeitou anúncio obsoleto de {new_leader_id} (termo {term}, atual {current_term}).")
+            stale_announcements.inc()
+            return {"status": "STALE", "term": current_term}
+
+        if new_leader_id < process_id:
+            # Um processo menor se proclamou líder (ex.: a mensagem de eleição para este
+            # processo se perdeu). Pelo Bully, o maior processo vivo deve liderar: adota
+            # o termo, rejeita o anúncio e disputa uma nova eleição.
+            log(f"Processo {process_id} rejeitou o líder {new_leader_id} (ID menor, termo {term}). Iniciando eleição.")
+            current_term = term
+            stale_announcements.inc()
+            threading.Thread(target=start_election).start()
+            return {"status": "STALE", "term": current_term}
+
         if leader_id != new_leader_id:
-            print(f"Processo {process_id} reconheceu o novo líder: {new_leader_id}.")
+            log(f"Processo {process_id} reconheceu o novo líder: {new_leader_id} (termo {term}).")
             leader_id = new_leader_id
-        is_election_happening = False
+        leader_term = term
+        current_term = term
+        # A expiração é calculada com o relógio local, evitando depender da sincronia entre nós
+        lease_expiry = time.time() + data.get("lease_duration", LEASE_DURATION)
+        finish_election()
         
-    return {"status": "ACK"}
+    return {"status": "ACK", "term": current_term}
 
 @app.post("/trigger_election")
 def trigger_election_endpoint():
     """Endpoint externo para iniciar uma eleição manualmente."""
-    print(f"Processo {process_id} recebeu um gatilho externo para iniciar a eleição.")
+    log(f"Processo {process_id} recebeu um gatilho externo para iniciar a eleição.")
     threading.Thread(target=start_election).start()
     return {"message": "Processo de eleição iniciado."}
 
@@ -118,9 +249,29 @@ def get_status():
     return {
         "process_id": process_id,
         "leader_id": leader_id,
+        "leader_term": leader_term,
+        "term": current_term,
+        "lease_expiry": lease_expiry,
         "is_election_happening": is_election_happening,
+        "elections_started": elections_started,
     }
 
+@app.get("/leader")
+def get_leader():
+    """
+    Retorna (líder, termo, expiração da concessão).
+    Clientes podem guardar o líder em cache até lease_expiry sem consultar a cada requisição.
+    """
+    with state_lock:
+        if not lease_is_valid():
+            return {"leader_id": None, "term": current_term, "lease_expiry": None}
+        return {"leader_id": leader_id, "term": current_term, "lease_expiry": lease_expiry}
+
+@app.get("/metrics")
+def get_metrics(format: str = "prometheus"):
+    """Contadores e histogramas de latência do processo (Prometheus, ou JSON com ?format=json)."""
+    return metrics.response(format)
+
 @app.get("/healthcheck")
 def healthcheck():
     """Endpoint simples para verificar se o processo está ativo."""
@@ -128,44 +279,77 @@ def healthcheck():
 
 # --- Tarefa em Background para Detecção de Falhas ---
 
+def check_leader_health_once():
+    """
+    Uma verificação de saúde: se o líder está inativo, inicia uma eleição.
+    Uma concessão expirada também é tratada como falha do líder.
+    """
+    global is_election_happening
+    with state_lock:
+        # Uma eleição sem anúncio dentro de uma concessão (ex.: o processo superior
+        # que respondeu caiu em seguida) é abandonada para que possa ser refeita
+        if is_election_happening and time.time() - election_started_at > LEASE_DURATION:
+            log(f"Processo {process_id}: eleição sem anúncio de líder. Reiniciando.")
+            is_election_happening = False
+            elections_abandoned.inc()
+
+        # Não faz nada se uma eleição já está ocorrendo ou se este processo é o líder
+        if is_election_happening or leader_id == process_id:
+            return
+        current_leader = leader_id
+        lease_expired = not lease_is_valid()
+
+    # A eleição é iniciada fora do lock, pois start_election também o adquire
+    if current_leader is None:
+        log(f"Processo {process_id}: Nenhum líder conhecido. Iniciando eleição.")
+        start_election()
+        return
+
+    if lease_expired:
+        log(f"Processo {process_id}: Concessão do líder {current_leader} expirou. Iniciando eleição.")
+        leader_failure_counter("lease_expired").inc()
+        start_election()
+        return
+
+    # Se há um líder com concessão válida, verifica sua saúde
+    try:
+        send_to_process(current_leader, "/healthcheck", timeout=2)
+    except requests.RequestException:
+        log(f"Processo {process_id}: Falha ao contatar o líder {current_leader}. Iniciando eleição.")
+        leader_failure_counter("unreachable").inc()
+        start_election()
+
 def check_leader_health():
-    """Verifica periodicamente se o líder está ativo. Se não, inicia uma eleição."""
-    while True:
-        time.sleep(10) # Verifica a cada 10 segundos
-        
+    """Verifica periodicamente a saúde do líder (ver check_leader_health_once)."""
+    while not stop_event.wait(HEALTHCHECK_INTERVAL):
+        check_leader_health_once()
+
+def renew_leader_lease():
+    """Enquanto for o líder, renova periodicamente a concessão junto aos demais processos."""
+    while not stop_event.wait(LEASE_RENEW_INTERVAL):
         with state_lock:
-            # Não faz nada se uma eleição já está ocorrendo ou se este processo é o líder
-            if is_election_happening or leader_id == process_id:
-                continue
-            
-            # Se não há líder, inicia uma eleição
-            if leader_id is None:
-                print(f"Processo {process_id}: Nenhum líder conhecido. Iniciando eleição.")
-                start_election()
-                continue
-
-        # Se há um líder, verifica sua saúde
-        try:
-            url = f"http://app-{leader_id}:8000/healthcheck"
-            requests.get(url, timeout=2)
-        except requests.RequestException:
-            print(f"Processo {process_id}: Falha ao contatar o líder {leader_id}. Iniciando eleição.")
-            start_election()
+            is_leader = leader_id == process_id
+        if is_leader:
+            announce_leader(renewal=True)
 
 if __name__ == "__main__":
     # Aguarda um tempo para que todos os pods iniciem antes de começar as verificações
-    print(f"Processo {process_id} iniciado. Aguardando 15s para estabilização do cluster...")
+    log(f"Processo {process_id} iniciado. Aguardando 15s para estabilização do cluster...")
     time.sleep(15)
     
     # Inicia a thread em background para verificar a saúde do líder
     health_check_thread = threading.Thread(target=check_leader_health, daemon=True)
     health_check_thread.start()
 
+    # Inicia a thread que renova a concessão enquanto este processo for o líder
+    lease_renewal_thread = threading.Thread(target=renew_leader_lease, daemon=True)
+    lease_renewal_thread.start()
+
     # O processo com maior ID se declara líder inicialmente para começar o sistema
     if process_id == max(all_processes):
-        print(f"Processo {process_id} é o de maior ID, assumindo liderança inicial.")
+        log(f"Processo {process_id} é o de maior ID, assumindo liderança inicial.")
         time.sleep(2) # Pequeno delay para garantir que os outros processos estejam escutando
         announce_leader()
     
-    print(f"Servidor do processo {process_id} rodando.")
+    log(f"Servidor do processo {process_id} rodando.")
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""
+Benchmark de tempo de failover do algoritmo Bully.
+
+Roda sobre o simulador determinístico do repositório (simulation/): N cópias do
+app.py no mesmo processo Python, cada uma com seu próprio estado global, ligadas
+por uma rede virtual com latência e perda configuráveis, em tempo virtual. Em
+cada rodada o cluster estabiliza, o líder (ou os K maiores processos) é
+derrubado e são medidos:
+
+  - tempo até todos os processos vivos reconhecerem o novo líder;
+  - mensagens enviadas durante o failover;
+  - eleições duplicadas (eleições iniciadas além da primeira).
+
+Uso:
+    python benchmark_failover.py --sizes 3 5 8 --runs 20 --kill 1 --latency 0.002 --loss 0.05
+"""
+import argparse
+import os
+import sys
+from typing import Optional
+
+# Permite importar common/ e simulation/ da raiz do repositório
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.metrics import percentile
+from simulation.clusters import BullyCluster
+
+
+def run_once(size: int, args, seed: int) -> Optional[dict]:
+    """Executa uma rodada: estabiliza o cluster, derruba os maiores processos e mede o failover."""
+    cluster = BullyCluster(size, seed=seed, latency=args.latency, jitter=args.jitter, loss=args.loss,
+                           healthcheck_interval=args.healthcheck_interval, lease=args.lease)
+    cluster.start()
+    if not cluster.scheduler.run(until=args.max_wait, stop=cluster.converged):
+        return None
+    return cluster.failover(kill=args.kill, max_wait=args.max_wait)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de failover do algoritmo Bully")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 5, 8], help="Tamanhos de cluster")
+    parser.add_argument("--runs", type=int, default=10, help="Rodadas por tamanho de cluster")
+    parser.add_argument("--kill", type=int, default=1, help="Quantidade de processos de maior ID derrubados")
+    parser.add_argument("--latency", type=float, default=0.002, help="Latência de ida da rede (s)")
+    parser.add_argument("--jitter", type=float, default=0.001, help="Variação máxima da latência (s)")
+    parser.add_argument("--loss", type=float, default=0.0, help="Probabilidade de perda de cada mensagem")
+    parser.add_argument("--healthcheck-interval", type=float, default=0.2, help="HEALTHCHECK_INTERVAL (s)")
+    parser.add_argument("--lease", type=float, default=1.0, help="LEASE_DURATION (s)")
+    parser.add_argument("--max-wait", type=float, default=10.0, help="Tempo máximo por failover (s virtuais)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'N':>3} {'ok':>5} {'p50 (ms)':>9} {'p90 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'msgs p50':>9} {'msgs p99':>9} {'dup p50':>8} {'dup max':>8}")
+    for size in args.sizes:
+        if args.kill >= size:
+            print(f"{size:>3} ignorado: --kill deve ser menor que o tamanho do cluster")
+            continue
+        results = [run_once(size, args, seed=args.seed * 100003 + size * 1009 + run) for run in range(args.runs)]
+
+        ok = [r for r in results if r is not None]
+        if not ok:
+            print(f"{size:>3} {0:>2}/{len(results):<2} nenhuma rodada convergiu")
+            continue
+        failover = [r["failover"] * 1000 for r in ok]
+        messages = [r["messages"] for r in ok]
+        duplicates = [r["duplicate_elections"] for r in ok]
+        print(f"{size:>3} {len(ok):>2}/{len(results):<2} "
+              f"{percentile(failover, 50):>9.1f} {percentile(failover, 90):>9.1f} {percentile(failover, 99):>9.1f} "
+              f"{percentile(messages, 50):>9} {percentile(messages, 99):>9} "
+              f"{percentile(duplicates, 50):>8} {max(duplicates):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,25 @@
+import os
 import sys
-import time
 import threading
+import time
 import requests
 import uvicorn
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 from collections import defaultdict
 
+# Permite importar o pacote common/ da raiz do repositório
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.metrics import CONSOLE_LOG, Registry, log
+from common.transport import Transport
+from common.wire import WireSchema, body_parser, encode_body
+
 app = FastAPI()
+# Conexões keep-alive e pool de threads compartilhados pelos envios às réplicas
+transport = Transport()
+# Contadores e histogramas expostos em /metrics
+metrics = Registry()
 
 # ------------------------------------------------------------
 # Configuração
@@ -19,22 +30,48 @@ processes = [
     "localhost:8082",
 ]
 
+# Leitura com sessão: espera passiva pelas dependências antes da busca direcionada
+SESSION_FETCH_AFTER = float(os.getenv("SESSION_FETCH_AFTER", "0.5"))
+# Tempo máximo de uma leitura (ou escrita) com sessão antes de desistir
+SESSION_TIMEOUT = float(os.getenv("SESSION_TIMEOUT", "3"))
+
 # ------------------------------------------------------------
 # Estado global (instâncias e estruturas compartilhadas)
 # ------------------------------------------------------------
 myProcessId = 0          # id da réplica atual
-data_lock = threading.Lock() 
+data_lock = metrics.lock("data_lock")
 
 # Relógio Vetorial: Uma posição para cada processo
 vector_clock = [0] * len(processes)
 
 # Buffer para mensagens que chegaram mas não satisfazem dependências causais
 pending_buffer: List['Event'] = []
+# Instante de chegada de cada mensagem do buffer: {(processId, evtId): time.time()}
+buffered_at: Dict[tuple, float] = {}
 
 # Armazenamento de dados entregues
 posts = defaultdict(list)
 replies = defaultdict(list)
 
+# Eventos entregues por origem, na ordem de entrega: history[k][i] tem vector_clock[k] == i + 1.
+# Serve a busca direcionada (/events) das réplicas atrasadas.
+history: Dict[int, List['Event']] = defaultdict(list)
+
+# Leituras e escritas com sessão aguardando a réplica alcançar o relógio do cliente
+session_waiters: List['SessionWaiter'] = []
+
+# Métricas das etapas do broadcast causal
+events_posted = metrics.counter("events_posted_total", "Eventos criados localmente")
+events_received = metrics.counter("events_received_total", "Eventos recebidos de outras réplicas")
+events_delivered = metrics.counter("events_delivered_total", "Eventos de outras réplicas entregues")
+delivery_delay = metrics.histogram("delivery_delay_seconds",
+                                   "Tempo entre o recebimento e a entrega causal", buffer="causal")
+metrics.gauge("buffer_depth", "Mensagens retidas no buffer causal", fn=lambda: len(pending_buffer), buffer="causal")
+session_wait = metrics.histogram("session_wait_seconds",
+                                 "Espera de leituras e escritas com sessão até a réplica alcançar o cliente")
+session_fetches = metrics.counter("session_fetches_total", "Buscas direcionadas de eventos atrasados")
+session_timeouts = metrics.counter("session_timeouts_total", "Sessões não atendidas dentro do timeout")
+
 # ------------------------------------------------------------
 # Modelo de evento
 # ------------------------------------------------------------
@@ -47,6 +84,16 @@ class Event(BaseModel):
     # Agora usamos um Vetor de Inteiros em vez de um único int
     vector_clock: List[int] = [] 
 
+# Layout do formato binário usado entre as réplicas em /share (ver common/wire.py)
+EVENT_WIRE = WireSchema(
+    ("processId", "int"),
+    ("evtId", "str"),
+    ("parentEvtId", "opt_str"),
+    ("author", "str"),
+    ("text", "str"),
+    ("vector_clock", "int_list"),
+)
+
 # ------------------------------------------------------------
 # Lógica de Consistência Causal
 # ------------------------------------------------------------
@@ -99,25 +146,165 @@ def try_deliver_pending():
                 
                 # Atualiza nosso conhecimento sobre o remetente
                 vector_clock[msg.processId] += 1
+                history[msg.processId].append(msg)
                 
                 # Remove do buffer
                 pending_buffer.remove(msg)
+                received_at = buffered_at.pop((msg.processId, msg.evtId), None)
+                if received_at is not None:
+                    delivery_delay.observe(time.time() - received_at)
+                events_delivered.inc()
                 
-                print(f"[Buffer] Mensagem {msg.evtId} desbloqueada e entregue.")
+                log(f"[Buffer] Mensagem {msg.evtId} desbloqueada e entregue.")
                 
                 # Reinicia o loop pois o vector_clock mudou, talvez libere outras
                 changed = True 
                 break 
 
+    wake_sessions()
+
+
+def buffer_event(msg: Event) -> bool:
+    """
+    Coloca um evento de outra réplica no buffer, descartando os já entregues ou
+    já bufferizados (o mesmo evento pode chegar por /share e pela busca direcionada).
+    Requer data_lock.
+    """
+    if msg.vector_clock[msg.processId] <= vector_clock[msg.processId]:
+        return False
+    if (msg.processId, msg.evtId) in buffered_at:
+        return False
+    pending_buffer.append(msg)
+    buffered_at[(msg.processId, msg.evtId)] = time.time()
+    return True
+
+# ------------------------------------------------------------
+# Sessões do cliente (read-your-writes entre réplicas)
+# ------------------------------------------------------------
+# O token de sessão é o relógio vetorial do cliente, em texto ("3,0,1"). Toda
+# resposta com sessão devolve o token atualizado; leituras e escritas que o
+# apresentam a outra réplica só são atendidas depois que ela entregou tudo o que
+# o cliente já viu, em vez de devolver um feed desatualizado.
+
+class SessionWaiter:
+    """Leitura ou escrita aguardando a réplica alcançar o relógio da sessão."""
+
+    def __init__(self, clock: List[int]):
+        self.clock = clock
+        self.ready = threading.Event()
+
+
+def parse_session(token: str) -> Optional[List[int]]:
+    """Converte o token de sessão em relógio vetorial; None se for inválido."""
+    try:
+        clock = [int(part) for part in token.split(",")]
+    except ValueError:
+        return None
+    if len(clock) != len(processes) or any(c < 0 for c in clock):
+        return None
+    return clock
+
+
+def session_token(clock: List[int]) -> str:
+    return ",".join(str(c) for c in clock)
+
+
+def covers(clock: List[int]) -> bool:
+    """A réplica já entregou todos os eventos do relógio informado? Requer data_lock."""
+    return all(local >= needed for local, needed in zip(vector_clock, clock))
+
+
+def wake_sessions():
+    """Libera as sessões cujo relógio foi alcançado. Requer data_lock."""
+    for waiter in list(session_waiters):
+        if covers(waiter.clock):
+            session_waiters.remove(waiter)
+            waiter.ready.set()
+
+
+def fetch_missing(clock: List[int]):
+    """
+    Busca direcionada: pede a cada origem atrasada os eventos que faltam
+    (ou a outra réplica, se a origem não responder) e os entrega pelo buffer.
+    """
+    with data_lock:
+        lagging = {k: vector_clock[k] for k in range(len(processes))
+                   if k != myProcessId and vector_clock[k] < clock[k]}
+
+    for origin, after in lagging.items():
+        # A origem tem todos os seus eventos; qualquer outra réplica tem um prefixo deles
+        candidates = [origin] + [idx for idx in range(len(processes)) if idx not in (origin, myProcessId)]
+        for idx in candidates:
+            try:
+                response = transport.get(f"http://{processes[idx]}/events?origin={origin}&after={after}", timeout=1)
+                events = [Event(**e) for e in response.json()["events"]]
+            except (requests.RequestException, ValueError, KeyError):
+                continue
+            session_fetches.inc()
+            with data_lock:
+                for msg in events:
+                    if buffer_event(msg):
+                        events_received.inc()
+                try_deliver_pending()
+            if events and events[-1].vector_clock[origin] >= clock[origin]:
+                break
+
+
+def wait_for_session(clock: List[int], timeout: float) -> bool:
+    """
+    Aguarda até a réplica cobrir o relógio da sessão. Espera passivamente pelo
+    /share por até SESSION_FETCH_AFTER segundos e, se ainda faltar algo, faz a
+    busca direcionada. Retorna False se o timeout acabar antes.
+    """
+    start = time.time()
+    with data_lock:
+        if covers(clock):
+            session_wait.observe(0.0)
+            return True
+        waiter = SessionWaiter(clock)
+        session_waiters.append(waiter)
+
+    if not waiter.ready.wait(min(SESSION_FETCH_AFTER, timeout)):
+        fetch_missing(clock)
+        waiter.ready.wait(max(0.0, timeout - (time.time() - start)))
+
+    with data_lock:
+        # A entrega pode ter ocorrido entre o fim da espera e a aquisição do lock
+        if not waiter.ready.is_set():
+            session_waiters.remove(waiter)
+            session_timeouts.inc()
+            return False
+    session_wait.observe(time.time() - start)
+    return True
+
+
+def feed_snapshot() -> List[dict]:
+    """Posts entregues com suas respostas, na mesma ordem do showFeed. Requer data_lock."""
+    all_posts_flat = [p for p_list in posts.values() for p in p_list]
+    return [
+        {**p.dict(), "replies": [r.dict() for r in replies.get(p.evtId, [])]}
+        for p in sorted(all_posts_flat, key=lambda x: str(x.vector_clock))
+    ]
+
 # ------------------------------------------------------------
 # Endpoints HTTP
 # ------------------------------------------------------------
 
 @app.post("/post")
-def post(msg: Event):
+def post(msg: Event, session: Optional[str] = None, timeout: float = SESSION_TIMEOUT):
     """
     Cria um novo post localmente.
+    Com `session`, só cria o evento depois que a réplica entregou tudo o que o
+    cliente já viu, para que o novo evento dependa causalmente dessas leituras.
     """
+    clock = None
+    if session is not None:
+        clock = parse_session(session)
+        if clock is None:
+            return {"status": "Erro", "message": f"Token de sessão inválido: {session}"}
+        if not wait_for_session(clock, timeout):
+            return {"status": "Timeout", "message": f"Réplica não alcançou a sessão {session} em {timeout}s."}
+
     with data_lock:
         # 1. Incrementa seu próprio relógio antes de criar evento
         vector_clock[myProcessId] += 1
@@ -125,31 +312,36 @@ def post(msg: Event):
         # 2. Anexa snapshot do relógio ao evento
         msg.vector_clock = vector_clock[:]
         msg.processId = myProcessId
+        events_posted.inc()
         
-        print(f"\n[Novo Evento Local] {msg.evtId} Clock: {msg.vector_clock}")
+        log(f"\n[Novo Evento Local] {msg.evtId} Clock: {msg.vector_clock}")
 
         # 3. Processa localmente (entrega imediata pois é local)
         processMsg(msg)
+        history[myProcessId].append(msg)
+        wake_sessions()
     
     # 4. Disseminar
     for idx, address in enumerate(processes):
         if idx != myProcessId:
             async_send(f"http://{address}/share", msg.dict())
 
-    return {"status": "posted", "vector_clock": msg.vector_clock}
+    token = msg.vector_clock if clock is None else [max(a, b) for a, b in zip(msg.vector_clock, clock)]
+    return {"status": "posted", "vector_clock": msg.vector_clock, "session": session_token(token)}
 
 
 @app.post("/share")
-def share(msg: Event):
+def share(msg: Event = Depends(body_parser(Event, EVENT_WIRE))):
     """
     Recebe evento de outra réplica.
     NÃO entrega imediatamente. Coloca no buffer e tenta entregar respeitando causalidade.
     """
     with data_lock:
-        print(f"\n[Recebido] {msg.evtId} de P{msg.processId} Clock: {msg.vector_clock}")
+        log(f"\n[Recebido] {msg.evtId} de P{msg.processId} Clock: {msg.vector_clock}")
         
-        # Adiciona ao buffer primeiro
-        pending_buffer.append(msg)
+        # Adiciona ao buffer primeiro (ignorando o que a busca direcionada já trouxe)
+        if buffer_event(msg):
+            events_received.inc()
         
         # Tenta esvaziar o buffer se as dependências forem satisfeitas
         try_deliver_pending()
@@ -159,22 +351,56 @@ def share(msg: Event):
     return {"status": "received/buffered"}
 
 
+@app.get("/feed")
+def feed(session: Optional[str] = None, timeout: float = SESSION_TIMEOUT):
+    """
+    Lê o feed da réplica.
+    Com `session` (token devolvido por /post ou /feed em qualquer réplica), aguarda
+    a réplica alcançar o relógio do cliente, buscando os eventos que faltam se
+    preciso; se não conseguir dentro do timeout, responde Timeout em vez de dados antigos.
+    """
+    clock = [0] * len(processes)
+    if session is not None:
+        clock = parse_session(session)
+        if clock is None:
+            return {"status": "Erro", "message": f"Token de sessão inválido: {session}"}
+        if not wait_for_session(clock, timeout):
+            return {"status": "Timeout", "message": f"Réplica não alcançou a sessão {session} em {timeout}s."}
+
+    with data_lock:
+        token = [max(a, b) for a, b in zip(vector_clock, clock)]
+        return {
+            "status": "OK",
+            "vector_clock": vector_clock[:],
+            "session": session_token(token),
+            "posts": feed_snapshot(),
+        }
+
+
+@app.get("/events")
+def events(origin: int, after: int = 0):
+    """Eventos entregues da réplica `origin` com posição maior que `after` (busca direcionada)."""
+    with data_lock:
+        return {"events": [e.dict() for e in history.get(origin, [])[after:]]}
+
+
+@app.get("/metrics")
+def get_metrics(format: str = "prometheus"):
+    """
+    Contadores e histogramas de latência da réplica.
+    Formato texto do Prometheus por padrão, ou resumo em JSON com ?format=json.
+    """
+    return metrics.response(format)
+
+
 # ------------------------------------------------------------
 # Funções auxiliares
 # ------------------------------------------------------------
 
-def _send_thread(url: str, payload: dict):
-    try:
-        # Simula atraso no Nó 0 para forçar o cenário de buffer no Nó 1
-        if myProcessId == 0: 
-            time.sleep(3) 
-        requests.post(url, json=payload, timeout=5)
-    except Exception:
-        pass
-
 def async_send(url: str, payload: dict):
-    t = threading.Thread(target=_send_thread, args=(url, payload))
-    t.start()
+    # Simula atraso no Nó 0 para forçar o cenário de buffer no Nó 1
+    delay = 3 if myProcessId == 0 else 0
+    transport.post_async(url, timeout=5, delay=delay, **encode_body(EVENT_WIRE, payload))
 
 
 def processMsg(msg: Event):
@@ -205,13 +431,17 @@ def showFeed():
     """
     Exibe Feed (Entregues) e Buffer (Pendentes).
     """
+    # Com a saída desligada (CONSOLE_LOG=0), nem monta o feed
+    if not CONSOLE_LOG:
+        return
+
     # Se não for chamado dentro de um lock existente, usaríamos lock aqui.
     # Como showFeed é chamado dentro das rotas com lock, ok. 
     # Mas por segurança em prints concorrentes:
     
-    print("\n" + "="*60)
-    print(f" NÓ {myProcessId} | V.Clock Local: {vector_clock}")
-    print("="*60)
+    log("\n" + "="*60)
+    log(f" NÓ {myProcessId} | V.Clock Local: {vector_clock}")
+    log("="*60)
     
     # 1. Feed (Mensagens Causalmente Entregues)
     all_posts_flat = []
@@ -222,18 +452,18 @@ def showFeed():
     sorted_posts = sorted(all_posts_flat, key=lambda x: str(x.vector_clock))
 
     if not sorted_posts:
-        print("(Feed Vazio)")
+        log("(Feed Vazio)")
 
     for p in sorted_posts:
-        print(f"POST [{p.evtId}] {p.vector_clock} {p.author}: {p.text}")
+        log(f"POST [{p.evtId}] {p.vector_clock} {p.author}: {p.text}")
         p_replies = replies.get(p.evtId, [])
         for r in p_replies:
-            print(f"   └── RE [{r.evtId}] {r.vector_clock} {r.author}: {r.text}")
-        print("-" * 30)
+            log(f"   └── RE [{r.evtId}] {r.vector_clock} {r.author}: {r.text}")
+        log("-" * 30)
 
     # 2. Buffer (Mensagens Retidas por falta de Causalidade)
     if pending_buffer:
-        print(f"\n>>> BUFFER DE ESPERA (Violam Causalidade) - {len(pending_buffer)} msg(s) <<<")
+        log(f"\n>>> BUFFER DE ESPERA (Violam Causalidade) - {len(pending_buffer)} msg(s) <<<")
         for m in pending_buffer:
             reason = "Aguardando ordem correta"
             if m.parentEvtId and (m.parentEvtId not in posts or not posts[m.parentEvtId]):
@@ -241,11 +471,11 @@ def showFeed():
             elif m.vector_clock[m.processId] != vector_clock[m.processId] + 1:
                  reason = f"Gap de sequência do remetente P{m.processId}"
             
-            print(f" [BUFFERED] {m.evtId} (de P{m.processId}) ClockMsg: {m.vector_clock} -> Motivo: {reason}")
+            log(f" [BUFFERED] {m.evtId} (de P{m.processId}) ClockMsg: {m.vector_clock} -> Motivo: {reason}")
     else:
-        print("\n(Buffer vazio - Sistema Sincronizado)")
+        log("\n(Buffer vazio - Sistema Sincronizado)")
 
-    print("="*60 + "\n")
+    log("="*60 + "\n")
 
 
 # ------------------------------------------------------------
@@ -261,5 +491,5 @@ if __name__ == "__main__":
     full_address = processes[myProcessId]
     host, port_str = full_address.split(":")
     
-    print(f"Iniciando Causal Consistency Node {myProcessId}...")
+    log(f"Iniciando Causal Consistency Node {myProcessId}...")
     uvicorn.run(app, host=host, port=int(port_str), log_level="error")
\ No newline at end of file
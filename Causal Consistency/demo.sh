@@ -79,5 +79,20 @@ echo "   O sistema deve detectar que a dependência foi satisfeita."
 echo "   A mensagem 'evt_B' deve sair do Buffer automaticamente."
 echo ""
 
+sleep 2
+
+# 4. Sessão do cliente: lê em outra réplica o que acabou de escrever
+echo "🟣 [Sessão] Alice posta 'evt_C' no Nó 0 e guarda o token de sessão devolvido..."
+SESSION=$(curl -s -X POST http://localhost:8080/post \
+-H "Content-Type: application/json" \
+-d '{"processId": 0, "evtId": "evt_C", "author": "Alice", "text": "Segundo post", "vector_clock": []}' \
+| python -c 'import sys, json; print(json.load(sys.stdin)["session"])')
+echo "    -> Token: $SESSION"
+echo "    -> Lendo no Nó 1 com o token: o 'evt_C' ainda está atrasado na rede,"
+echo "       então o Nó 1 busca o evento no Nó 0 antes de responder (sem dado antigo)."
+curl -s "http://localhost:8081/feed?session=$SESSION"
+echo ""
+echo ""
+
 # Mantém rodando
 read -p "Pressione [Enter] para sair..."
\ No newline at end of file
@@ -1,27 +1,46 @@
+import os
 import sys
 import time
-import threading
-import requests
 import uvicorn
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 from collections import defaultdict
 
+# Permite importar o pacote common/ da raiz do repositório
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.metrics import CONSOLE_LOG, Registry, log
+from common.transport import Transport
+from common.wire import WireSchema, body_parser, encode_body
+
 app = FastAPI()
+# Conexões keep-alive e pool de threads compartilhados pelos envios às réplicas
+transport = Transport()
+# Contadores e histogramas expostos em /metrics
+metrics = Registry()
 
 # ------------------------------------------------------------
 # Estado global (instâncias e estruturas compartilhadas)
 # ------------------------------------------------------------
 myProcessId = 0          # id da réplica atual (definido via argv na inicialização)
 timestamp = 0            # relógio lógico (Lamport) local
-data_lock = threading.Lock() # Lock para proteger acesso concorrente às estruturas
+data_lock = metrics.lock("data_lock") # Lock para proteger acesso concorrente às estruturas
 
 # Revertido para defaultdict(list) conforme solicitado
 # Estrutura: {evtId: [Event, ...]}
 posts = defaultdict(list)
 # Replies agrupados pelo ID do pai: {parentEvtId: [Event, Event]}
 replies = defaultdict(list)
+# Posts pais ainda desconhecidos e o instante em que o primeiro reply órfão chegou
+orphaned_since: Dict[str, float] = {}
+
+# Métricas da disseminação
+events_posted = metrics.counter("events_posted_total", "Eventos criados localmente")
+events_received = metrics.counter("events_received_total", "Eventos recebidos via gossip")
+events_duplicated = metrics.counter("events_duplicated_total", "Eventos recebidos que já estavam no feed")
+send_failures = metrics.counter("send_failures_total", "Envios a outras réplicas que falharam")
+orphan_wait = metrics.histogram("orphan_wait_seconds", "Tempo entre o primeiro reply órfão e a chegada do post pai")
+metrics.gauge("orphan_parents", "Posts pais com replies órfãos", fn=lambda: len(orphaned_since))
 
 processes = [
     "localhost:8080",
@@ -40,6 +59,16 @@ class Event(BaseModel):
     text: str
     timestamp: Optional[int] = None # Relógio lógico do evento
 
+# Layout do formato binário usado entre as réplicas em /share (ver common/wire.py)
+EVENT_WIRE = WireSchema(
+    ("processId", "int"),
+    ("evtId", "str"),
+    ("parentEvtId", "opt_str"),
+    ("author", "str"),
+    ("text", "str"),
+    ("timestamp", "opt_int"),
+)
+
 # ------------------------------------------------------------
 # Endpoints HTTP
 # ------------------------------------------------------------
@@ -57,8 +86,9 @@ def post(msg: Event):
         msg.timestamp = timestamp
         # Sobrescreve o ID para garantir que é do nó atual se criado aqui
         msg.processId = myProcessId 
+        events_posted.inc()
 
-    print(f"\n[Novo Evento Local] {msg.evtId} por {msg.author}")
+    log(f"\n[Novo Evento Local] {msg.evtId} por {msg.author}")
 
     # 2. Processar localmente
     processMsg(msg)
@@ -74,7 +104,7 @@ def post(msg: Event):
 
 
 @app.post("/share")
-def share(msg: Event):
+def share(msg: Event = Depends(body_parser(Event, EVENT_WIRE))):
     """
     Endpoint usado para receber eventos enviados por outras réplicas.
     """
@@ -85,8 +115,9 @@ def share(msg: Event):
         if msg.timestamp and msg.timestamp > timestamp:
             timestamp = msg.timestamp
         timestamp += 1 # Incremento pelo evento de recebimento
+        events_received.inc()
 
-    print(f"\n[Recebido via Gossip] {msg.evtId} vindo do Proc {msg.processId}")
+    log(f"\n[Recebido via Gossip] {msg.evtId} vindo do Proc {msg.processId}")
 
     # 2. Processar msg
     processMsg(msg)
@@ -94,27 +125,34 @@ def share(msg: Event):
     return {"status": "received"}
 
 
+@app.get("/metrics")
+def get_metrics(format: str = "prometheus"):
+    """
+    Contadores e histogramas de latência da réplica.
+    Formato texto do Prometheus por padrão, ou resumo em JSON com ?format=json.
+    """
+    return metrics.response(format)
+
+
 # ------------------------------------------------------------
 # Funções auxiliares de rede e aplicação
 # ------------------------------------------------------------
 
-def _send_thread(url: str, payload: dict):
-    """Função interna executada pela thread."""
-    try:
-        # Simula atraso de rede aleatório para evidenciar a consistência eventual
-        if myProcessId == 0: 
-            time.sleep(2) # Nó 0 é artificialmente lento para enviar
-        
-        requests.post(url, json=payload, timeout=5)
-    except Exception as e:
-        print(f" [!] Falha ao enviar para {url}: {e}")
+def _report_send_failure(url: str, future):
+    """Callback executado ao fim do envio assíncrono."""
+    error = future.exception()
+    if error is not None:
+        send_failures.inc()
+        log(f" [!] Falha ao enviar para {url}: {error}")
 
 def async_send(url: str, payload: dict):
     """
     Envia um payload JSON para outra réplica de forma assíncrona.
     """
-    t = threading.Thread(target=_send_thread, args=(url, payload))
-    t.start()
+    # Simula atraso de rede para evidenciar a consistência eventual
+    delay = 2 if myProcessId == 0 else 0 # Nó 0 é artificialmente lento para enviar
+    future = transport.post_async(url, timeout=5, delay=delay, **encode_body(EVENT_WIRE, payload))
+    future.add_done_callback(lambda f: _report_send_failure(url, f))
 
 
 def processMsg(msg: Event):
@@ -128,14 +166,21 @@ def processMsg(msg: Event):
             # Lógica para defaultdict(list): verifica se msg já está na lista desse ID
             current_list = posts[msg.evtId]
             if any(p.evtId == msg.evtId and p.processId == msg.processId for p in current_list):
+                events_duplicated.inc()
                 return # Já temos
             posts[msg.evtId].append(msg)
+            orphaned = orphaned_since.pop(msg.evtId, None)
+            if orphaned is not None:
+                orphan_wait.observe(time.time() - orphaned)
         else:
             # Verifica duplicação na lista de replies
             current_replies = replies[msg.parentEvtId]
             if any(r.evtId == msg.evtId for r in current_replies):
+                events_duplicated.inc()
                 return # Já temos
             replies[msg.parentEvtId].append(msg)
+            if not posts.get(msg.parentEvtId):
+                orphaned_since.setdefault(msg.parentEvtId, time.time())
             # Ordena replies por timestamp para exibição consistente
             replies[msg.parentEvtId].sort(key=lambda x: x.timestamp or 0)
 
@@ -151,9 +196,13 @@ def showFeed():
     """
     Exibe no console o estado atual do feed local.
     """
-    print("\n" + "="*50)
-    print(f" FEED DO PROCESSO {myProcessId} | Clock Atual: {timestamp}")
-    print("="*50)
+    # Com a saída desligada (CONSOLE_LOG=0), nem monta o feed (que segura o data_lock)
+    if not CONSOLE_LOG:
+        return
+
+    log("\n" + "="*50)
+    log(f" FEED DO PROCESSO {myProcessId} | Clock Atual: {timestamp}")
+    log("="*50)
     
     with data_lock:
         # 1. Exibir Posts conhecidos
@@ -165,17 +214,17 @@ def showFeed():
         sorted_posts = sorted(all_posts_flat, key=lambda x: x.timestamp or 0)
 
         if not sorted_posts and not replies:
-            print("(Feed vazio)")
+            log("(Feed vazio)")
 
         for p in sorted_posts:
-            print(f"POST [{p.evtId}] (T={p.timestamp}) {p.author}: {p.text}")
+            log(f"POST [{p.evtId}] (T={p.timestamp}) {p.author}: {p.text}")
             
             # Exibir replies deste post
             p_replies = replies.get(p.evtId, [])
             for r in p_replies:
-                print(f"   └── RE [{r.evtId}] (T={r.timestamp}) {r.author}: {r.text}")
+                log(f"   └── RE [{r.evtId}] (T={r.timestamp}) {r.author}: {r.text}")
             
-            print("-" * 20)
+            log("-" * 20)
 
         # 2. Exibir Replies Órfãos (Consistência Eventual em ação)
         # Replies cujo parentEvtId não está no dicionário posts (ou a lista está vazia)
@@ -187,13 +236,13 @@ def showFeed():
         orphan_parents = all_parents_with_replies - known_posts_ids
 
         if orphan_parents:
-            print("\n>>> REPLIES ÓRFÃOS (Post pai ainda não chegou) <<<")
+            log("\n>>> REPLIES ÓRFÃOS (Post pai ainda não chegou) <<<")
             for parent_id in orphan_parents:
-                print(f"Ref: Pai desconhecido <{parent_id}>")
+                log(f"Ref: Pai desconhecido <{parent_id}>")
                 for r in replies[parent_id]:
-                    print(f"   └── RE [{r.evtId}] (T={r.timestamp}) {r.author}: {r.text}")
+                    log(f"   └── RE [{r.evtId}] (T={r.timestamp}) {r.author}: {r.text}")
 
-    print("="*50 + "\n")
+    log("="*50 + "\n")
 
 
 # ------------------------------------------------------------
@@ -212,7 +261,7 @@ if __name__ == "__main__":
     host, port_str = full_address.split(":")
     port = int(port_str)
 
-    print(f"Iniciando Processo {myProcessId} em {host}:{port}...")
+    log(f"Iniciando Processo {myProcessId} em {host}:{port}...")
     
     # Executa o servidor
     uvicorn.run(app, host=host, port=port, log_level="error")
\ No newline at end of file
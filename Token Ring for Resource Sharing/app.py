@@ -1,116 +1,599 @@
+import asyncio
 import fastapi
 import requests
 import os
+import sys
 import uvicorn
 import threading
 import time
+import itertools
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+# Permite importar o pacote common/ da raiz do repositório ao rodar localmente
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.metrics import Registry, log
+from common.transport import Transport, connection_refused, not_delivered
 
 app = fastapi.FastAPI()
+# Conexões keep-alive reutilizadas entre as mensagens para os outros processos
+transport = Transport()
+# Contadores e histogramas expostos em /metrics
+metrics = Registry()
 
 process_id = int(os.getenv("PROCESS_ID", "1"))
 all_processes = [1, 2, 3]
-next_process_id = (process_id % len(all_processes)) + 1
+
+# Recursos protegidos, cada um com seu próprio token circulando pelo anel
+RESOURCES = [name.strip() for name in os.getenv("RESOURCES", "default").split(",") if name.strip()]
+DEFAULT_RESOURCE = RESOURCES[0]
+
+# Modo de roteamento do token:
+#   "ring":   o token circula pelo anel, visitando cada processo em ordem;
+#   "demand": o token vai direto ao próximo processo que o pediu (Suzuki–Kasami)
+#             e fica parado quando ninguém o deseja.
+TOKEN_MODE = os.getenv("TOKEN_MODE", "ring")
+if TOKEN_MODE not in ("ring", "demand"):
+    raise ValueError(f"TOKEN_MODE inválido: {TOKEN_MODE} (use 'ring' ou 'demand')")
+
+# Espera antes de repassar o token: curta enquanto há demanda no anel, longa quando ocioso
+FAST_HOP_DELAY = float(os.getenv("FAST_HOP_DELAY", "0.05"))
+IDLE_HOP_DELAY = float(os.getenv("IDLE_HOP_DELAY", "1"))
+# Tempo sem ver o token após o qual ele é considerado perdido (padrão: duas voltas ociosas + folga)
+TOKEN_TIMEOUT = float(os.getenv("TOKEN_TIMEOUT", str(2 * len(all_processes) * IDLE_HOP_DELAY + 2)))
+# Atraso adicional por posição no anel, para que apenas um processo regenere o token
+REGEN_STAGGER = float(os.getenv("REGEN_STAGGER", "1"))
+# Máximo de pedidos locais atendidos em uma mesma visita do token (justiça entre processos)
+MAX_GRANTS_PER_VISIT = int(os.getenv("MAX_GRANTS_PER_VISIT", "4"))
+# Tempo máximo de espera padrão de /acquire
+ACQUIRE_TIMEOUT = float(os.getenv("ACQUIRE_TIMEOUT", "30"))
+# Duração padrão da concessão (lease) da SC; ao expirar, a SC é liberada à força
+CS_LEASE_SECONDS = float(os.getenv("CS_LEASE_SECONDS", "30"))
 
 # --- Estado Protegido ---
-# Lock para proteger TODAS as variáveis de estado
-state_lock = threading.Lock()
-
-has_token = False
-wants_to_enter_cs = False
-in_critical_section = False
-
-def pass_token():
-    global has_token
-    
-    # O Lock deve ser adquirido ANTES de ler ou escrever o estado
-    # No entanto, pass_token geralmente é chamado de dentro de funções 
-    # que já seguram o lock (recursividade). 
-    # Para simplificar, vamos assumir que quem chama pass_token já tem o lock
-    # ou vamos checar o estado cuidadosamente.
-    
-    # OBS: requests.post é I/O bloqueante e lento. 
-    # NÃO devemos segurar o lock durante a requisição de rede se possível,
-    # mas devemos segurar enquanto modificamos has_token.
-    
-    should_send = False
-    
-    with state_lock:
-        if has_token:
-            has_token = False
-            should_send = True
-    
-    if should_send:
-        print(f"Processo {process_id} passando o token...")
+
+grant_ids = itertools.count(1)
+
+class Waiter:
+    """Pedido local de acesso à SC, aguardando na fila do recurso."""
+
+    def __init__(self, lease: float, on_grant: Optional[Callable[[], None]] = None):
+        self.grant_id = next(grant_ids)
+        self.granted = threading.Event()
+        # Chamada (com state_lock) no momento da concessão; usada pelo /acquire assíncrono
+        self.on_grant = on_grant
+        self.requested_at = time.time()
+        self.lease = lease
+        self.granted_at: Optional[float] = None
+        self.lease_expiry: Optional[float] = None
+
+    def grant(self):
+        """Concede a SC ao pedido, iniciando sua concessão."""
+        self.granted_at = time.time()
+        self.lease_expiry = self.granted_at + self.lease
+        self.granted.set()
+        if self.on_grant:
+            self.on_grant()
+
+class ResourceState:
+    """
+    Estado do token de um recurso neste processo.
+    Todos os campos são protegidos por state_lock; recursos diferentes não
+    compartilham lock, então não se bloqueiam entre si.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state_lock = metrics.lock("state_lock", resource=name)
+        self.has_token = False
+        # Pedidos locais em ordem de chegada (FIFO) e o pedido que ocupa a SC
+        self.waiters: Deque[Waiter] = deque()
+        self.holder: Optional[Waiter] = None
+        # Pedidos atendidos na visita atual do token
+        self.grants_this_visit = 0
+        # Estatísticas de tempo de posse da SC
+        self.holds = 0
+        self.total_hold_seconds = 0.0
+        self.max_hold_seconds = 0.0
+        self.last_hold_seconds: Optional[float] = None
+        self.forced_releases = 0
+        # Saltos desde o último uso da SC (viaja junto com o token).
+        # Após uma volta completa sem uso, o anel é considerado ocioso.
+        self.hops_since_use = 0
+        # Indica que algum processo avisou que deseja o token (ver /token_demand)
+        self.demand_hint = False
+        # Geração do token como (número, processo que o gerou). Tokens de gerações
+        # menores que a maior já vista são descartados.
+        self.token_generation = (0, 0)
+        self.held_generation = (0, 0)
+        self.last_token_seen = time.time()
+        self.tokens_regenerated = 0
+        self.last_recovery_seconds: Optional[float] = None
+        # Modo sob demanda: maior número de pedido visto de cada processo (RN) e,
+        # enquanto o token está aqui, o último pedido atendido de cada um (LN)
+        # e a fila de processos à espera, ambos carregados pelo token
+        self.request_numbers: Dict[int, int] = {p: 0 for p in all_processes}
+        self.token_ln: Dict[int, int] = {p: 0 for p in all_processes}
+        self.token_queue: List[int] = []
+        # Acorda a thread do token: token recebido, pedido local ou SC liberada
+        self.token_event = threading.Event()
+        # Chegada anterior do token, para medir o tempo de volta
+        self.last_token_arrival: Optional[float] = None
+        # Métricas do recurso
+        self.round_trip = metrics.histogram("token_round_trip_seconds",
+                                            "Tempo entre duas chegadas consecutivas do token", resource=name)
+        self.hop_latency = metrics.histogram("token_hop_seconds",
+                                             "Duração do envio do token ao próximo processo", resource=name)
+        self.cs_wait = metrics.histogram("cs_wait_seconds", "Espera entre o pedido e a concessão da SC", resource=name)
+        self.cs_hold = metrics.histogram("cs_hold_seconds", "Tempo de posse da SC", resource=name)
+        self.tokens_received = metrics.counter("tokens_received_total", "Tokens recebidos", resource=name)
+        self.token_passes = metrics.counter("token_passes_total", "Envios do token a outro processo", resource=name)
+        metrics.gauge("cs_queue_depth", "Pedidos locais aguardando a SC", fn=lambda: len(self.waiters), resource=name)
+
+    @property
+    def wants_to_enter_cs(self) -> bool:
+        return bool(self.waiters)
+
+    @property
+    def in_critical_section(self) -> bool:
+        return self.holder is not None
+
+    def can_grant(self) -> bool:
+        """Há pedido local e a visita atual do token ainda não atingiu o limite de concessões."""
+        return bool(self.waiters) and self.grants_this_visit < MAX_GRANTS_PER_VISIT
+
+    def finish_hold(self, forced: bool):
+        """Encerra a posse atual da SC, registrando sua duração."""
+        held = time.time() - self.holder.granted_at
+        self.holds += 1
+        self.total_hold_seconds += held
+        self.max_hold_seconds = max(self.max_hold_seconds, held)
+        self.last_hold_seconds = held
+        self.cs_hold.observe(held)
+        if forced:
+            self.forced_releases += 1
+        self.holder = None
+
+    def token_silence(self) -> Optional[float]:
+        """
+        Segundos sem ver o token enquanto ele deveria aparecer, ou None se não há
+        perda a detectar. No modo sob demanda o token pode ficar parado indefinidamente,
+        então só conta o tempo em que este processo está esperando por ele.
+        """
+        if self.has_token:
+            return None
+        if TOKEN_MODE == "demand":
+            if not self.waiters:
+                return None
+            return time.time() - max(self.last_token_seen, self.waiters[0].requested_at)
+        return time.time() - self.last_token_seen
+
+    def hop_delay(self) -> float:
+        """Tempo de espera antes de repassar o token, conforme a demanda conhecida."""
+        if self.demand_hint or self.hops_since_use < len(all_processes):
+            return FAST_HOP_DELAY
+        return IDLE_HOP_DELAY
+
+    def status(self) -> dict:
+        return {
+            "has_token": self.has_token,
+            "wants_to_enter_cs": self.wants_to_enter_cs,
+            "in_critical_section": self.in_critical_section,
+            "waiting": len(self.waiters),
+            "holder_grant_id": self.holder.grant_id if self.holder else None,
+            "current_hold_seconds": time.time() - self.holder.granted_at if self.holder else None,
+            "lease_remaining_seconds": self.holder.lease_expiry - time.time() if self.holder else None,
+            "holds": self.holds,
+            "avg_hold_seconds": self.total_hold_seconds / self.holds if self.holds else None,
+            "max_hold_seconds": self.max_hold_seconds,
+            "last_hold_seconds": self.last_hold_seconds,
+            "forced_releases": self.forced_releases,
+            "request_number": self.request_numbers.get(process_id, 0),
+            "hops_since_use": self.hops_since_use,
+            "token_generation": list(self.token_generation),
+            "seconds_since_token_seen": time.time() - self.last_token_seen,
+            "tokens_regenerated": self.tokens_regenerated,
+            "last_recovery_seconds": self.last_recovery_seconds,
+        }
+
+resources: Dict[str, ResourceState] = {name: ResourceState(name) for name in RESOURCES}
+
+def unknown_resource(resource: str) -> dict:
+    return {"status": "Erro", "message": f"Recurso desconhecido: {resource}."}
+
+def successors():
+    """Processos seguintes no anel, em ordem, a partir do próximo deste processo."""
+    index = all_processes.index(process_id)
+    return all_processes[index + 1:] + all_processes[:index]
+
+def pass_token(res: ResourceState):
+    """
+    Envia o token do recurso ao próximo processo vivo do anel.
+    Chamada apenas pela thread do token, nunca de dentro de uma requisição HTTP:
+    o destino confirma o recebimento imediatamente, então o timeout cobre um único salto.
+    """
+    with res.state_lock:
+        if not res.has_token or res.in_critical_section:
+            return
+        if res.can_grant():
+            # Um pedido local chegou durante a espera: a thread do token o atende
+            res.token_event.set()
+            return
+        res.has_token = False
+        # Um aviso de demanda (ou pedidos locais que excederam o limite da visita)
+        # reinicia a contagem para que o token circule rápido por uma volta
+        hops = 0 if res.demand_hint or res.waiters else res.hops_since_use + 1
+        res.demand_hint = False
+        res.grants_this_visit = 0
+        payload = {"resource": res.name, "hops_since_use": hops, "generation": list(res.held_generation)}
+
+    for next_id in successors():
+        log(f"Processo {process_id} passando o token de '{res.name}' para {next_id}...")
+        try:
+            url = f"http://app-{next_id}:8000/receive_token"
+            started = time.time()
+            transport.post(url, json=payload, timeout=2)
+            res.hop_latency.observe(time.time() - started)
+            res.token_passes.inc()
+            return
+        except requests.RequestException as e:
+            if not_delivered(e):
+                # Conexão recusada ou não estabelecida: o token não saiu daqui
+                log(f"Processo {next_id} inacessível, tentando o seguinte: {e}")
+                continue
+            # Timeout de leitura ou conexão interrompida: o token pode ter sido entregue.
+            # Para não duplicá-lo, ele é considerado enviado; se tiver se perdido, o
+            # detector o regenera.
+            log(f"Erro ao passar token para {next_id}: {e}")
+            return
+
+    # Nenhum sucessor está acessível: mantém o token e tenta novamente mais tarde
+    log(f"Processo {process_id}: nenhum sucessor acessível, mantendo o token de '{res.name}'.")
+    with res.state_lock:
+        res.has_token = True
+        res.hops_since_use = len(all_processes)
+    res.token_event.set()
+
+def send_token_on_demand(res: ResourceState):
+    """
+    Modo sob demanda: entrega o token diretamente ao próximo processo da fila do token.
+    Sem pedidos pendentes, o token fica parado aqui e nenhuma mensagem é enviada.
+    """
+    with res.state_lock:
+        if not res.has_token or res.in_critical_section or res.can_grant():
+            return
+        # Todos os pedidos deste processo até agora foram atendidos
+        res.token_ln[process_id] = res.request_numbers.get(process_id, 0)
+        for p_id in all_processes:
+            if (p_id != process_id and p_id not in res.token_queue
+                    and res.request_numbers.get(p_id, 0) > res.token_ln.get(p_id, 0)):
+                res.token_queue.append(p_id)
+        if not res.token_queue:
+            # Ninguém mais espera o token: o limite da visita só serve para cedê-lo a
+            # outros processos, então uma nova visita começa e os pedidos locais seguem
+            res.grants_this_visit = 0
+            if res.waiters:
+                res.token_event.set()
+            return
+        res.has_token = False
+        res.grants_this_visit = 0
+        still_waiting = bool(res.waiters)
+        queue = list(res.token_queue)
+        ln = dict(res.token_ln)
+        res.token_queue = []
+
+    while queue:
+        target = queue.pop(0)
+        payload = {
+            "resource": res.name,
+            "generation": list(res.held_generation),
+            "ln": {str(p): n for p, n in ln.items()},
+            "queue": queue,
+        }
+        log(f"Processo {process_id} enviando o token de '{res.name}' para {target} (fila: {queue}).")
         try:
-            url = f"http://app-{next_process_id}:8000/receive_token"
-            requests.post(url, timeout=10)
-        except Exception as e:
-            print(f"Erro ao passar token: {e}")
-
-def process_received_token():
-    global in_critical_section, wants_to_enter_cs
-    
-    with state_lock:
-        if wants_to_enter_cs:
-            in_critical_section = True
-            wants_to_enter_cs = False
-            print(f"Processo {process_id} ENTROU na SC.")
-            should_pass = False
-        else:
-            print(f"Processo {process_id} passando token adiante.")
-            should_pass = True
-
-    # Realiza a ação fora do bloco do lock principal se envolver I/O pesado ou sleep
-    if should_pass:
-        time.sleep(1) 
-        pass_token()
+            started = time.time()
+            transport.post(f"http://app-{target}:8000/receive_token", json=payload, timeout=2)
+            res.hop_latency.observe(time.time() - started)
+            res.token_passes.inc()
+            break
+        except requests.RequestException as e:
+            if not not_delivered(e):
+                # O token pode ter sido entregue (ver pass_token)
+                log(f"Erro ao enviar token para {target}: {e}")
+                break
+            # Quem pediu caiu: o pedido é dado como atendido e o próximo da fila recebe o token
+            log(f"Processo {target} inacessível, entregando ao próximo da fila: {e}")
+            with res.state_lock:
+                ln[target] = res.request_numbers.get(target, 0)
+    else:
+        # Nenhum processo da fila está acessível: o token continua aqui
+        with res.state_lock:
+            res.has_token = True
+            res.token_ln = ln
+        res.token_event.set()
+        return
+
+    if still_waiting:
+        # Pedidos locais além do limite da visita precisam de um novo pedido do token
+        broadcast_request(res)
+
+def broadcast_request(res: ResourceState):
+    """Modo sob demanda: anuncia a todos um novo pedido deste processo pelo token do recurso."""
+    with res.state_lock:
+        res.request_numbers[process_id] = res.request_numbers.get(process_id, 0) + 1
+        payload = {"resource": res.name, "requester": process_id, "seq": res.request_numbers[process_id]}
+
+    for p_id in all_processes:
+        if p_id != process_id:
+            try:
+                transport.post(f"http://app-{p_id}:8000/sk_request", json=payload, timeout=0.5)
+            except requests.RequestException:
+                pass
+
+def token_worker_step(res: ResourceState) -> Optional[float]:
+    """
+    Uma rodada da thread do token, após token_event ser sinalizado: entra na SC
+    quando há pedido local ou, no modo sob demanda, entrega o token a quem o pediu.
+    No modo anel, retorna o atraso a aguardar antes de repassar o token com
+    pass_token; None indica que não há o que repassar agora.
+    """
+    with res.state_lock:
+        if not res.has_token or res.in_critical_section:
+            return None
+        if res.held_generation < res.token_generation:
+            # Uma geração mais nova foi criada enquanto este token estava parado aqui
+            log(f"Processo {process_id} descartando token obsoleto de '{res.name}' {res.held_generation}.")
+            res.has_token = False
+            return None
+        res.last_token_seen = time.time()
+        if res.can_grant():
+            # Atende o próximo pedido da fila sem devolver o token ao anel
+            res.holder = res.waiters.popleft()
+            res.grants_this_visit += 1
+            res.hops_since_use = 0
+            res.holder.grant()
+            res.cs_wait.observe(res.holder.granted_at - res.holder.requested_at)
+            log(f"Processo {process_id} ENTROU na SC de '{res.name}'.")
+            return None
+        # Limite da visita atingido com pedidos pendentes: repassa sem esperar
+        delay = 0 if res.waiters else res.hop_delay()
+
+    if TOKEN_MODE == "demand":
+        send_token_on_demand(res)
+        return None
+    return delay
+
+def token_worker(res: ResourceState):
+    """
+    Thread dedicada ao token de um recurso: executa token_worker_step a cada sinal
+    e, no modo anel, repassa o token após o atraso adaptativo.
+    """
+    while True:
+        res.token_event.wait()
+        res.token_event.clear()
+
+        delay = token_worker_step(res)
+        if delay is None:
+            continue
+        # A espera é interrompida por um pedido local (token_event), que é reavaliado acima
+        if delay and res.token_event.wait(delay):
+            continue
+        pass_token(res)
+
+def notify_demand(res: ResourceState):
+    """Avisa os demais processos que este deseja o token do recurso, acelerando sua circulação."""
+    for p_id in all_processes:
+        if p_id != process_id:
+            try:
+                url = f"http://app-{p_id}:8000/token_demand"
+                transport.post(url, json={"resource": res.name}, timeout=0.5)
+            except requests.RequestException:
+                pass
+
+def enqueue_waiter(res: ResourceState, lease: float, on_grant: Optional[Callable[[], None]] = None) -> Waiter:
+    """Coloca um pedido local na fila do recurso e acorda quem pode atendê-lo."""
+    waiter = Waiter(lease, on_grant)
+    with res.state_lock:
+        res.waiters.append(waiter)
+        holding = res.has_token
+        position = len(res.waiters)
+    log(f"Processo {process_id} deseja entrar na SC de '{res.name}' (posição {position} na fila).")
+
+    if holding:
+        res.token_event.set()
+    elif position == 1:
+        # Pedidos seguintes já encontram o aviso (ou pedido do token) enviado pelo primeiro
+        announce = broadcast_request if TOKEN_MODE == "demand" else notify_demand
+        threading.Thread(target=announce, args=(res,), daemon=True).start()
+    return waiter
+
+def withdraw_waiter(res: ResourceState, waiter: Waiter) -> bool:
+    """Retira da fila um pedido ainda não concedido. Retorna False se ele já foi concedido."""
+    with res.state_lock:
+        # A concessão pode ter ocorrido entre o fim da espera e a aquisição do lock
+        if waiter.granted.is_set():
+            return False
+        res.waiters.remove(waiter)
+        return True
 
 @app.post("/request_cs")
-def request_cs():
-    global wants_to_enter_cs
-    with state_lock:
-        if in_critical_section:
-            return {"status": "Erro", "message": "Já na SC."}
-        if wants_to_enter_cs:
-            return {"status": "OK", "message": "Já aguardando."}
-        
-        print(f"Processo {process_id} deseja entrar na SC.")
-        wants_to_enter_cs = True
-    return {"status": "OK"}
+def request_cs(resource: str = DEFAULT_RESOURCE, lease: float = CS_LEASE_SECONDS):
+    """Pede acesso à SC sem bloquear; o resultado é acompanhado por /status."""
+    res = resources.get(resource)
+    if res is None:
+        return unknown_resource(resource)
+    if lease <= 0:
+        return {"status": "Erro", "message": "A concessão deve ser positiva."}
+
+    waiter = enqueue_waiter(res, lease)
+    return {"status": "OK", "grant_id": waiter.grant_id}
+
+@app.post("/acquire")
+async def acquire(resource: str = DEFAULT_RESOURCE, timeout: float = ACQUIRE_TIMEOUT, lease: float = CS_LEASE_SECONDS):
+    """
+    Pede acesso à SC e aguarda (long-poll) até a concessão ou o fim do timeout.
+    Vários pedidos locais são atendidos em ordem de chegada. A SC é concedida por
+    `lease` segundos; depois disso é liberada à força, a menos que seja renovada.
+    A espera acontece no event loop, sem ocupar uma thread do pool do FastAPI:
+    muitos /acquire pendentes não atrasam /release_cs, /receive_token e /status.
+    Só os trechos que tomam o state_lock (disputado com a thread do token) rodam
+    em threads, para não bloquear o event loop.
+    """
+    res = resources.get(resource)
+    if res is None:
+        return unknown_resource(resource)
+    if lease <= 0:
+        return {"status": "Erro", "message": "A concessão deve ser positiva."}
+
+    loop = asyncio.get_running_loop()
+    granted = asyncio.Event()
+    # A concessão ocorre na thread do token; o aviso é repassado ao event loop
+    enqueued = loop.run_in_executor(None, enqueue_waiter, res, lease,
+                                    lambda: loop.call_soon_threadsafe(granted.set))
+    try:
+        # shield: uma desconexão do cliente não interrompe o trecho que já está na thread
+        waiter = await asyncio.shield(enqueued)
+        await asyncio.wait_for(granted.wait(), timeout)
+    except asyncio.TimeoutError:
+        if await asyncio.shield(loop.run_in_executor(None, withdraw_waiter, res, waiter)):
+            return {"status": "Timeout", "message": f"SC de '{resource}' não concedida em {timeout}s."}
+    except asyncio.CancelledError:
+        # Cliente desconectou: o pedido é retirado da fila assim que estiver nela; se
+        # já foi concedido, a SC é liberada pela expiração da concessão
+        enqueued.add_done_callback(
+            lambda done: loop.run_in_executor(None, withdraw_waiter, res, done.result()))
+        raise
+
+    return {
+        "status": "OK",
+        "grant_id": waiter.grant_id,
+        "waited_seconds": waiter.granted_at - waiter.requested_at,
+        "lease_expiry": waiter.lease_expiry,
+    }
+
+def current_holder_error(res: ResourceState, grant_id: Optional[int]) -> Optional[dict]:
+    """Verifica se a SC está ocupada pela concessão informada (se houver). Requer state_lock."""
+    if not res.in_critical_section:
+        return {"status": "Erro", "message": "Não está na SC."}
+    if grant_id is not None and res.holder.grant_id != grant_id:
+        # A concessão expirou e a SC já pertence a outro pedido
+        return {"status": "Erro", "message": f"Concessão {grant_id} não ocupa mais a SC."}
+    return None
+
+@app.post("/renew_cs")
+def renew_cs(resource: str = DEFAULT_RESOURCE, lease: float = CS_LEASE_SECONDS, grant_id: Optional[int] = None):
+    """Renova a concessão da SC por mais `lease` segundos a partir de agora."""
+    res = resources.get(resource)
+    if res is None:
+        return unknown_resource(resource)
+    if lease <= 0:
+        return {"status": "Erro", "message": "A concessão deve ser positiva."}
+
+    with res.state_lock:
+        error = current_holder_error(res, grant_id)
+        if error:
+            return error
+        res.holder.lease_expiry = time.time() + lease
+        return {"status": "OK", "grant_id": res.holder.grant_id, "lease_expiry": res.holder.lease_expiry}
 
 @app.post("/release_cs")
-def release_cs():
-    global in_critical_section
-    
-    should_pass = False
-    with state_lock:
-        if not in_critical_section:
-            return {"status": "Erro", "message": "Não está na SC."}
-        
-        print(f"Processo {process_id} saindo da SC.")
-        in_critical_section = False
-        should_pass = True
-    
-    if should_pass:
-        pass_token()
-        
+def release_cs(resource: str = DEFAULT_RESOURCE, grant_id: Optional[int] = None):
+    res = resources.get(resource)
+    if res is None:
+        return unknown_resource(resource)
+
+    with res.state_lock:
+        error = current_holder_error(res, grant_id)
+        if error:
+            return error
+
+        log(f"Processo {process_id} saindo da SC de '{resource}'.")
+        res.finish_hold(forced=False)
+
+    # A thread do token repassa o token; a requisição retorna sem esperar o envio
+    res.token_event.set()
     return {"status": "OK"}
 
 @app.post("/receive_token")
-def receive_token():
-    global has_token
-    
-    process_it = False
-    with state_lock:
-        if has_token:
+def receive_token(data: Optional[dict] = None):
+    """Confirma o recebimento do token imediatamente; o processamento fica com a thread do token."""
+    data = data or {}
+    res = resources.get(data.get("resource", DEFAULT_RESOURCE))
+    if res is None:
+        return unknown_resource(data.get("resource"))
+
+    with res.state_lock:
+        generation = tuple(data.get("generation", res.token_generation))
+        if generation < res.token_generation:
+            log(f"Processo {process_id} descartou token obsoleto de '{res.name}' {generation}.")
+            return {"status": "Obsoleto"}
+        if res.has_token and generation <= res.held_generation:
             return {"status": "Ignorado"}
-        print(f"Processo {process_id} RECEBEU o token.")
-        has_token = True
-        process_it = True
-    
-    if process_it:
-        process_received_token()
-        
+        log(f"Processo {process_id} RECEBEU o token de '{res.name}' (geração {generation}).")
+        res.has_token = True
+        res.token_generation = generation
+        res.held_generation = generation
+        res.last_token_seen = time.time()
+        if res.last_token_arrival is not None:
+            res.round_trip.observe(res.last_token_seen - res.last_token_arrival)
+        res.last_token_arrival = res.last_token_seen
+        res.tokens_received.inc()
+        res.hops_since_use = data.get("hops_since_use", 0)
+        res.grants_this_visit = 0
+        if "ln" in data:
+            res.token_ln = {int(p): n for p, n in data["ln"].items()}
+            res.token_queue = list(data.get("queue", []))
+
+    res.token_event.set()
+    return {"status": "ACK"}
+
+@app.post("/token_demand")
+def token_demand(data: Optional[dict] = None):
+    """Recebe o aviso de que outro processo aguarda o token de um recurso."""
+    resource = (data or {}).get("resource", DEFAULT_RESOURCE)
+    res = resources.get(resource)
+    if res is None:
+        return unknown_resource(resource)
+
+    with res.state_lock:
+        res.demand_hint = True
+        holding = res.has_token
+    if holding:
+        res.token_event.set()
+    return {"status": "ACK"}
+
+@app.post("/sk_request")
+def sk_request(data: dict):
+    """Modo sob demanda: recebe o pedido do token de outro processo."""
+    res = resources.get(data.get("resource", DEFAULT_RESOURCE))
+    if res is None:
+        return unknown_resource(data.get("resource"))
+
+    requester = data["requester"]
+    with res.state_lock:
+        res.request_numbers[requester] = max(res.request_numbers.get(requester, 0), data["seq"])
+        holding = res.has_token
+    # Se o token está parado aqui, a thread do token o entrega ao solicitante
+    if holding:
+        res.token_event.set()
+    return {"status": "ACK"}
+
+@app.post("/token_regenerated")
+def token_regenerated(data: dict):
+    """Recebe o aviso de que um processo regenerou o token de um recurso com uma nova geração."""
+    res = resources.get(data.get("resource", DEFAULT_RESOURCE))
+    if res is None:
+        return unknown_resource(data.get("resource"))
+
+    generation = tuple(data.get("generation"))
+    with res.state_lock:
+        if generation > res.token_generation:
+            log(f"Processo {process_id}: token de '{res.name}' regenerado pelo processo {generation[1]} (geração {generation}).")
+            res.token_generation = generation
+            res.last_token_seen = time.time()
+    # Se este processo ainda tinha um token antigo, a thread do token o descarta
+    res.token_event.set()
     return {"status": "ACK"}
 
 @app.get("/status")
@@ -118,35 +601,193 @@ def get_status():
     """Retorna o estado atual do processo para fins de depuração."""
     return {
         "process_id": process_id,
-        "has_token": has_token,
-        "wants_to_enter_cs": wants_to_enter_cs,
-        "in_critical_section": in_critical_section,
+        "token_mode": TOKEN_MODE,
+        "resources": {name: res.status() for name, res in resources.items()},
     }
 
+@app.get("/metrics")
+def get_metrics(format: str = "prometheus"):
+    """Contadores e histogramas de latência por recurso (Prometheus, ou JSON com ?format=json)."""
+    return metrics.response(format)
+
+# --- Detecção de Perda do Token ---
+
+def probe_peers(res: ResourceState) -> Optional[Dict[int, dict]]:
+    """
+    Consulta o estado do recurso nos demais processos. Processos que recusam a
+    conexão (fora do ar) são omitidos: o token, se estava lá, se perdeu junto com
+    o processo. Retorna None se algum não responder por timeout, pois ele pode
+    estar vivo e com o token (ex.: partição de rede).
+    """
+    statuses = {}
+    for p_id in all_processes:
+        if p_id == process_id:
+            continue
+        try:
+            statuses[p_id] = transport.get(f"http://app-{p_id}:8000/status", timeout=1).json()["resources"][res.name]
+        except KeyError:
+            continue
+        except requests.RequestException as e:
+            if connection_refused(e):
+                continue
+            log(f"Processo {process_id}: processo {p_id} não respondeu à consulta do token de '{res.name}' ({e}).")
+            return None
+    return statuses
+
+def regenerate_token_if_lost(res: ResourceState):
+    """
+    Regenera o token do recurso se ninguém o viu por TOKEN_TIMEOUT (mais um atraso
+    pela posição no anel). Antes de regenerar, consulta os demais processos (ver
+    probe_peers): se algum ainda possui o token (por exemplo, ocupando a SC), nada é
+    feito; se algum não responder, a regeneração é adiada para a próxima verificação.
+    """
+    timeout = TOKEN_TIMEOUT + all_processes.index(process_id) * REGEN_STAGGER
+    with res.state_lock:
+        silence = res.token_silence()
+        if silence is None or silence < timeout:
+            return
+        newest = res.token_generation
+    # Último pedido atendido de cada processo, para reconstruir o LN do token (modo sob demanda)
+    served = {p: n for p, n in res.request_numbers.items()}
+
+    statuses = probe_peers(res)
+    if statuses is None:
+        log(f"Processo {process_id}: regeneração do token de '{res.name}' adiada.")
+        return
+    for p_id, status in statuses.items():
+        generation = tuple(status.get("token_generation", (0, 0)))
+        newest = max(newest, generation)
+        served[p_id] = status.get("request_number", 0) - (1 if status.get("waiting") else 0)
+        if status.get("has_token") and generation >= res.token_generation:
+            # O token existe: apenas está parado ou circulando por outro caminho
+            with res.state_lock:
+                res.last_token_seen = time.time()
+                res.token_generation = max(res.token_generation, generation)
+            if TOKEN_MODE == "demand":
+                # O pedido deste processo pode ter se perdido: é reenviado ao detentor
+                broadcast_request(res)
+            return
+
+    with res.state_lock:
+        # O token pode ter chegado (ou sido regenerado por outro) durante a consulta
+        silence = res.token_silence()
+        if silence is None or silence < timeout:
+            return
+        res.token_generation = (newest[0] + 1, process_id)
+        res.held_generation = res.token_generation
+        res.has_token = True
+        res.hops_since_use = 0
+        res.token_ln = served
+        res.token_queue = []
+        res.tokens_regenerated += 1
+        res.last_recovery_seconds = silence
+        res.last_token_seen = time.time()
+        payload = {"resource": res.name, "generation": list(res.token_generation)}
+        log(f"Processo {process_id} REGENEROU o token de '{res.name}' (geração {res.token_generation}) "
+              f"após {res.last_recovery_seconds:.1f}s sem vê-lo.")
+
+    for p_id in all_processes:
+        if p_id != process_id:
+            try:
+                transport.post(f"http://app-{p_id}:8000/token_regenerated", json=payload, timeout=0.5)
+            except requests.RequestException:
+                pass
+    res.token_event.set()
+
+def release_expired_leases():
+    """Libera à força as SCs cujas concessões expiraram, devolvendo o token ao algoritmo."""
+    now = time.time()
+    for res in resources.values():
+        with res.state_lock:
+            if res.holder is None or now < res.holder.lease_expiry:
+                continue
+            log(f"Processo {process_id}: concessão {res.holder.grant_id} da SC de '{res.name}' "
+                  f"expirou. Liberando à força.")
+            res.finish_hold(forced=True)
+        res.token_event.set()
+
+def cs_lease_watchdog():
+    """Verifica as concessões da SC a cada 100 ms."""
+    while True:
+        time.sleep(0.1)
+        release_expired_leases()
+
+def token_loss_detector():
+    """Verifica periodicamente se o token de algum recurso se perdeu."""
+    while True:
+        time.sleep(1)
+        for res in resources.values():
+            regenerate_token_if_lost(res)
+
 # --- Inicialização do Processo ---
 
+def initial_token_owner(resource: str) -> int:
+    """Processo que cria o token inicial do recurso; os tokens são distribuídos pelo anel."""
+    return all_processes[RESOURCES.index(resource) % len(all_processes)]
+
+def claim_initial_tokens() -> bool:
+    """
+    Cria os tokens iniciais dos recursos pelos quais este processo é responsável.
+    Se o processo foi reiniciado, o token pode já estar circulando: os demais são
+    consultados e o token só é criado se nenhum deles viu uma geração. Caso contrário,
+    o processo adota a maior geração vista e, se o token tiver se perdido, a detecção
+    de perda o regenera. Retorna False se algum recurso ficou sem decisão porque
+    nem todos os processos responderam.
+    """
+    decided = True
+    for res in resources.values():
+        if initial_token_owner(res.name) != process_id or res.token_generation > (0, 0):
+            continue
+        statuses = probe_peers(res)
+        if statuses is None:
+            decided = False
+            continue
+        seen = max((tuple(status.get("token_generation", (0, 0))) for status in statuses.values()), default=(0, 0))
+        with res.state_lock:
+            res.last_token_seen = time.time()
+            if max(seen, res.token_generation) > (0, 0):
+                res.token_generation = max(res.token_generation, seen)
+                log(f"Processo {process_id}: token de '{res.name}' já existe (geração {res.token_generation}).")
+                continue
+            log(f"Processo {process_id} assume a posse inicial do token de '{res.name}'.")
+            res.has_token = True
+            res.token_generation = (1, process_id)
+            res.held_generation = res.token_generation
+        res.token_event.set()
+    return decided
+
 def initial_token_holder():
     """
-    Função executada em uma thread separada pelo processo 1 para iniciar a circulação do token.
+    Função executada em uma thread separada para iniciar a circulação dos tokens
+    dos recursos pelos quais este processo é responsável.
     Espera um tempo para garantir que os outros processos estejam online.
     """
     # Espera para dar tempo aos outros contêineres/processos de iniciarem
     startup_delay = 5
-    print(f"Processo 1 (inicializador) aguardando {startup_delay}s antes de iniciar o anel...")
+    log(f"Processo {process_id} (inicializador) aguardando {startup_delay}s antes de iniciar o anel...")
     time.sleep(startup_delay)
-    
-    global has_token
-    print("Processo 1 assume a posse inicial do token.")
-    has_token = True
-    process_received_token()
+    while not claim_initial_tokens():
+        time.sleep(1)
 
 if __name__ == "__main__":
-    # Apenas o processo com ID 1 começa com o token.
-    if process_id == 1:
-        # Inicia uma thread para dar o pontapé inicial na circulação do token.
+    # Uma thread dedicada por recurso processa e repassa seu token de forma assíncrona
+    for res in resources.values():
+        threading.Thread(target=token_worker, args=(res,), daemon=True).start()
+
+    # Thread que detecta a perda dos tokens e os regenera
+    loss_detector_thread = threading.Thread(target=token_loss_detector, daemon=True)
+    loss_detector_thread.start()
+
+    # Thread que libera SCs com concessão expirada
+    lease_watchdog_thread = threading.Thread(target=cs_lease_watchdog, daemon=True)
+    lease_watchdog_thread.start()
+
+    # Cada token começa em um processo diferente (com um único recurso, o processo 1).
+    if any(initial_token_owner(name) == process_id for name in RESOURCES):
+        # Inicia uma thread para dar o pontapé inicial na circulação dos tokens.
         # Usar uma thread evita bloquear a inicialização do servidor uvicorn.
         initialization_thread = threading.Thread(target=initial_token_holder, daemon=True)
         initialization_thread.start()
 
-    print(f"Processo {process_id} iniciado. Próximo no anel: {next_process_id}.")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    log(f"Processo {process_id} iniciado (modo {TOKEN_MODE}). Próximo no anel: {successors()[0]}. Recursos: {RESOURCES}.")
+    uvicorn.run(app, host="0.0.0.0", port=8000)
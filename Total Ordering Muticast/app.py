@@ -1,21 +1,45 @@
 import fastapi
-import requests
 from pydantic import BaseModel, Field
 import os
+import sys
 import uvicorn
 import threading
 import time
-from typing import List
+from typing import Dict, List, Tuple
+
+# Permite importar o pacote common/ da raiz do repositório ao rodar localmente
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.metrics import CONSOLE_LOG, Registry, log
+from common.transport import Transport
+from common.wire import WireSchema, body_parser, encode_body
 
 app = fastapi.FastAPI()
+# Conexões keep-alive reutilizadas entre as mensagens para os outros processos
+transport = Transport()
+# Contadores e histogramas expostos em /metrics
+metrics = Registry()
 
 # --- Variáveis Globais ---
 message_queue = []
-queue_lock = threading.Lock() # Lock para garantir acesso thread-safe à fila
+queue_lock = metrics.lock("queue_lock") # Lock para garantir acesso thread-safe à fila
 acks_received = {} # Dicionário para rastrear ACKs: {(origin_id, timestamp): {ack_source_1, ...}}
 internal_clock = 0 # Relógio lógico de Lamport
 process_id = int(os.getenv("PROCESS_ID", "1"))
 all_processes = [1, 2, 3] # IDs de todos os processos no sistema
+# Instante em que cada mensagem entrou na fila: {(origin_id, timestamp): time.time()}
+enqueued_at: Dict[Tuple[int, int], float] = {}
+# Mensagens na fila que ainda aguardam ACKs de algum processo (mesma chave e valor)
+awaiting_acks: Dict[Tuple[int, int], float] = {}
+
+# --- Métricas ---
+messages_received = metrics.counter("messages_received_total", "Mensagens recebidas de outros processos")
+external_messages = metrics.counter("external_messages_total", "Mensagens recebidas de clientes externos")
+acks_counter = metrics.counter("acks_received_total", "ACKs recebidos de outros processos")
+messages_delivered = metrics.counter("messages_delivered_total", "Mensagens entregues em ordem total")
+delivery_delay = metrics.histogram("delivery_delay_seconds",
+                                   "Tempo entre a entrada na fila e a entrega", buffer="total_order")
+ack_wait = metrics.histogram("ack_wait_seconds", "Tempo entre a entrada na fila e o último ACK necessário")
+metrics.gauge("buffer_depth", "Mensagens na fila aguardando entrega", fn=lambda: len(message_queue), buffer="total_order")
 
 # --- Modelos Pydantic ---
 class Message(BaseModel):
@@ -38,6 +62,26 @@ class Ack(BaseModel):
     message_timestamp: int
     ack_origin_id: int
 
+# Layouts do formato binário usado entre os processos (ver common/wire.py)
+MESSAGE_WIRE = WireSchema(("data", "str"), ("origin_id", "int"), ("timestamp", "int"))
+ACK_WIRE = WireSchema(("message_origin_id", "int"), ("message_timestamp", "int"), ("ack_origin_id", "int"))
+
+# --- Medição de Espera ---
+
+def track_enqueued(message_key: Tuple[int, int]):
+    '''Registra a entrada de uma mensagem na fila (requer queue_lock)'''
+    now = time.time()
+    enqueued_at[message_key] = now
+    awaiting_acks[message_key] = now
+    record_ack_completion(message_key)
+
+def record_ack_completion(message_key: Tuple[int, int]):
+    '''Mede a espera por ACKs quando a mensagem da fila recebe o último deles (requer queue_lock)'''
+    if message_key not in awaiting_acks:
+        return
+    if acks_received.get(message_key, set()) | {process_id} == set(all_processes):
+        ack_wait.observe(time.time() - awaiting_acks.pop(message_key))
+
 # --- Funções de Broadcast ---
 
 def broadcast_message(message: Message):
@@ -47,9 +91,9 @@ def broadcast_message(message: Message):
             try:
                 # O endpoint para receber mensagens de outros processos
                 url = f"http://app-{process}:8000/recieve_message"
-                requests.post(url, json=message.model_dump(), timeout=0.5)
+                transport.post(url, timeout=0.5, **encode_body(MESSAGE_WIRE, message.model_dump()))
             except Exception as e:
-                print(f"ERROR: Falha ao enviar mensagem para o processo {process}: {e}")
+                log(f"ERROR: Falha ao enviar mensagem para o processo {process}: {e}")
 
 
 def broadcast_ack(original_message: Message):
@@ -64,31 +108,34 @@ def broadcast_ack(original_message: Message):
         if process != process_id:
             try:
                 url = f"http://app-{process}:8000/recieve_ack"
-                requests.post(url, json=ack_message.model_dump(), timeout=0.5)
+                transport.post(url, timeout=0.5, **encode_body(ACK_WIRE, ack_message.model_dump()))
             except Exception as e:
-                print(f"ERROR: Falha ao enviar ACK para o processo {process}: {e}")
+                log(f"ERROR: Falha ao enviar ACK para o processo {process}: {e}")
 
 # --- Endpoints da API ---
 
 @app.post('/recieve_external_message')
 def recieve_external_message(message: str):
     '''Recebe uma mensagem de um cliente externo e inicia o multicast'''
-    print(f"DEBUG: Process {process_id} received external message: '{message}'")
+    log(f"DEBUG: Process {process_id} received external message: '{message}'")
     global internal_clock
     internal_clock += 1
+    external_messages.inc()
     with queue_lock:
         new_message = Message(data=message, origin_id=process_id, timestamp=internal_clock)
-        print(f"DEBUG: Process {process_id} created new message: {new_message.model_dump_json()}")
+        log(f"DEBUG: Process {process_id} created new message: {new_message.model_dump_json()}")
         message_queue.append(new_message)
-        message_queue.sort(key=lambda m: (m.timestamp))
+        # Ordem total de Lamport: timestamp, com o ID do processo desempatando
+        message_queue.sort(key=lambda m: (m.timestamp, m.origin_id))
+        track_enqueued((new_message.origin_id, new_message.timestamp))
     broadcast_message(new_message) # Broadcast fora do lock para não bloquear por I/O
     return 
 
 
 @app.post('/recieve_message')
-def recieve_message(message: Message):
+def recieve_message(message: Message = fastapi.Depends(body_parser(Message, MESSAGE_WIRE))):
     '''Recebe uma mensagem de outro processo'''
-    print(f"DEBUG: Process {process_id} received message from process {message.origin_id} with timestamp {message.timestamp}")
+    log(f"DEBUG: Process {process_id} received message from process {message.origin_id} with timestamp {message.timestamp}")
     global internal_clock
     internal_clock = max(internal_clock, message.timestamp) + 1
 
@@ -101,16 +148,18 @@ def recieve_message(message: Message):
 
         acks_received[message_key].add(message.origin_id)
         message_queue.append(message)
-        message_queue.sort(key=lambda m: (m.timestamp))
+        message_queue.sort(key=lambda m: (m.timestamp, m.origin_id))
+        track_enqueued(message_key)
+    messages_received.inc()
     # Envia ACK para todos os outros processos
-    print(f"DEBUG: Process {process_id} broadcasting ACK for message from {message.origin_id} with timestamp {message.timestamp}")
+    log(f"DEBUG: Process {process_id} broadcasting ACK for message from {message.origin_id} with timestamp {message.timestamp}")
     broadcast_ack(message)
     return 
         
 @app.post('/recieve_ack')
-def recieve_ack(ack: Ack):
+def recieve_ack(ack: Ack = fastapi.Depends(body_parser(Ack, ACK_WIRE))):
     '''Recebe um ACK de outro processo'''
-    print(f"DEBUG: Process {process_id} received ACK from {ack.ack_origin_id} for message ({ack.message_origin_id}, {ack.message_timestamp})")
+    log(f"DEBUG: Process {process_id} received ACK from {ack.ack_origin_id} for message ({ack.message_origin_id}, {ack.message_timestamp})")
     # Encontra a mensagem na fila que corresponde ao ACK
     message_key = (ack.message_origin_id, ack.message_timestamp)
     with queue_lock:
@@ -119,31 +168,50 @@ def recieve_ack(ack: Ack):
             acks_received[message_key] = set()
         # Adiciona o ACK. Esta operação é O(1) e funciona mesmo se a mensagem ainda não chegou.
         acks_received[message_key].add(ack.ack_origin_id)
-        print(f"DEBUG: Process {process_id} updated ACKs for message {message_key}. New acks: {acks_received[message_key]}")
+        record_ack_completion(message_key)
+        log(f"DEBUG: Process {process_id} updated ACKs for message {message_key}. New acks: {acks_received[message_key]}")
+    acks_counter.inc()
     return 
 
+@app.get('/metrics')
+def get_metrics(format: str = "prometheus"):
+    '''Contadores e histogramas de latência (Prometheus, ou JSON com ?format=json)'''
+    return metrics.response(format)
+
 # --- Lógica de Entrega de Mensagens ---
 
+# Intervalo entre as verificações da cabeça da fila
+DELIVERY_INTERVAL = 1
+
+def deliver_next_message():
+    '''Entrega a mensagem da cabeça da fila se ela já recebeu todos os ACKs. Retorna a mensagem entregue, se houver'''
+    delivered_message = None
+    with queue_lock:
+        # A verificação e o pop() agora são uma operação atômica
+        if message_queue and message_queue[0].verify_acks():
+            delivered_message = message_queue.pop(0)
+            # Limpa a entrada de ACKs para a mensagem entregue para não consumir memória
+            if delivered_message:
+                message_key = (delivered_message.origin_id, delivered_message.timestamp)
+                acks_received.pop(message_key, None)
+                awaiting_acks.pop(message_key, None)
+                delivery_delay.observe(time.time() - enqueued_at.pop(message_key, time.time()))
+    
+    if delivered_message:
+        messages_delivered.inc()
+        # Acessar delivered_message fora do lock para não segurá-lo durante o print
+        log(f"DELIVERED: '{delivered_message.data}' from process {delivered_message.origin_id} with timestamp {delivered_message.timestamp}")
+    elif CONSOLE_LOG: # Só checar a cabeça da fila se nada foi entregue (e houver saída no console)
+        with queue_lock:
+            if message_queue and (message_queue[0].origin_id, message_queue[0].timestamp) in acks_received:
+                log(f"DEBUG: Process {process_id} waiting for ACKs for message ({message_queue[0].origin_id}, {message_queue[0].timestamp}). ACKs already received: {acks_received.get((message_queue[0].origin_id, message_queue[0].timestamp))}")
+    return delivered_message
+
 def deliver_messages():
     '''Verifica a fila e entrega as mensagens que receberam todos os ACKs em ordem'''
     while True:
-        delivered_message = None
-        with queue_lock:
-            # A verificação e o pop() agora são uma operação atômica
-            if message_queue and message_queue[0].verify_acks():
-                delivered_message = message_queue.pop(0)
-                # Limpa a entrada de ACKs para a mensagem entregue para não consumir memória
-                if delivered_message:
-                    acks_received.pop((delivered_message.origin_id, delivered_message.timestamp), None)
-        
-        if delivered_message:
-            # Acessar delivered_message fora do lock para não segurá-lo durante o print
-            print(f"DELIVERED: '{delivered_message.data}' from process {delivered_message.origin_id} with timestamp {delivered_message.timestamp}")
-        else: # Só checar a cabeça da fila se nada foi entregue
-            with queue_lock:
-                if message_queue and (message_queue[0].origin_id, message_queue[0].timestamp) in acks_received:
-                    print(f"DEBUG: Process {process_id} waiting for ACKs for message ({message_queue[0].origin_id}, {message_queue[0].timestamp}). ACKs already received: {acks_received.get((message_queue[0].origin_id, message_queue[0].timestamp))}")
-        time.sleep(1)
+        deliver_next_message()
+        time.sleep(DELIVERY_INTERVAL)
 
 if __name__ == "__main__":
     # Inicialização do processo
@@ -153,5 +221,5 @@ if __name__ == "__main__":
     delivery_thread = threading.Thread(target=deliver_messages, daemon=True)
     delivery_thread.start()
     
-    print(f"Processo {process_id} iniciado.")
+    log(f"Processo {process_id} iniciado.")
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
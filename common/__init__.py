@@ -0,0 +1 @@
+"""Código compartilhado pelos nós dos cinco algoritmos."""
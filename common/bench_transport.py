@@ -0,0 +1,84 @@
+"""
+Microbenchmark do transporte entre nós.
+
+Sobe um servidor HTTP local (keep-alive) e compara, para o mesmo número de
+mensagens JSON pequenas, a latência por mensagem e o tempo de CPU do cliente
+entre requests.post (uma conexão por mensagem) e Transport.post (pool keep-alive).
+A CPU medida é só a da thread cliente.
+
+Uso (a partir da raiz do repositório):
+    python -m common.bench_transport --messages 2000
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from common.metrics import percentile
+from common.transport import Transport
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Como o uvicorn, desativa o algoritmo de Nagle; sem isso, cabeçalho e corpo
+    # enviados separadamente esperam o ACK atrasado do cliente em conexões keep-alive
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"status":"ACK"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(send, url, payload, messages):
+    """
+    Envia as mensagens em sequência e retorna (latências em µs, CPU em µs por mensagem).
+    A CPU é a da thread cliente (thread_time): o servidor de eco roda no mesmo
+    processo, e process_time somaria também o trabalho das threads dele.
+    """
+    latencies = []
+    cpu_start = time.thread_time()
+    for _ in range(messages):
+        start = time.perf_counter()
+        send(url, json=payload, timeout=5)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    cpu = (time.thread_time() - cpu_start) * 1e6 / messages
+    return latencies, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark do transporte HTTP entre nós")
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/recieve_ack"
+    payload = json.loads('{"message_origin_id": 1, "message_timestamp": 42, "ack_origin_id": 2}')
+
+    transport = Transport()
+    # Aquecimento: abre a conexão do pool e carrega os módulos de ambos os caminhos
+    requests.post(url, json=payload, timeout=5)
+    transport.post(url, json=payload)
+
+    print(f"{'cliente':<16} {'p50 (µs)':>10} {'p99 (µs)':>10} {'CPU/msg (µs)':>13}")
+    for name, send in (("requests.post", requests.post), ("Transport.post", transport.post)):
+        latencies, cpu = measure(send, url, payload, args.messages)
+        print(f"{name:<16} {percentile(latencies, 50):>10.0f} {percentile(latencies, 99):>10.0f} {cpu:>13.0f}")
+
+    transport.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Microbenchmark do formato de fio das mensagens entre nós.
+
+Compara, para um Event igual ao da Consistência Causal, o tamanho do corpo e o
+tempo de CPU por mensagem de:
+  - JSON: serialização + model_validate_json (caminho de clientes externos);
+  - binário: WireSchema.encode + decode + model_validate (tráfego entre nós).
+
+No pydantic 2 a validação JSON é feita em Rust: o formato binário reduz o
+tamanho da mensagem, mas não a CPU.
+
+Uso (a partir da raiz do repositório):
+    python -m common.bench_wire --clock-sizes 3 16 64
+"""
+import argparse
+import json
+import time
+from typing import List, Optional
+
+import pydantic
+from pydantic import BaseModel
+
+from common.wire import WireSchema
+
+
+class Event(BaseModel):
+    processId: int
+    evtId: str
+    parentEvtId: Optional[str] = None
+    author: str
+    text: str
+    vector_clock: List[int]
+
+
+EVENT_WIRE = WireSchema(
+    ("processId", "int"),
+    ("evtId", "str"),
+    ("parentEvtId", "opt_str"),
+    ("author", "str"),
+    ("text", "str"),
+    ("vector_clock", "int_list"),
+)
+
+
+def cpu_per_message(fn, messages):
+    """Menor tempo de CPU por mensagem (µs) entre algumas repetições."""
+    best = float("inf")
+    for _ in range(5):
+        start = time.process_time()
+        for _ in range(messages):
+            fn()
+        best = min(best, (time.process_time() - start) * 1e6 / messages)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark do formato de fio entre nós")
+    parser.add_argument("--clock-sizes", type=int, nargs="+", default=[3, 16, 64],
+                        help="Tamanhos do relógio vetorial (número de processos)")
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"pydantic {pydantic.VERSION}")
+    print(f"{'N':>4} {'JSON (B)':>9} {'bin (B)':>8} {'JSON (µs)':>10} {'bin (µs)':>9}")
+    for size in args.clock_sizes:
+        values = {
+            "processId": 1,
+            "evtId": "5f0c6f4e-8d7a-4c1e-9d55-2b1f3e9a7c10",
+            "parentEvtId": "0b6d2a71-3f8e-4a09-b3c4-7e5d9c1a2f48",
+            "author": "Paulo",
+            "text": "Resposta a uma postagem",
+            "vector_clock": list(range(size)),
+        }
+        json_body = json.dumps(values).encode("utf-8")
+        binary_body = EVENT_WIRE.encode(values)
+
+        json_cpu = cpu_per_message(
+            lambda: Event.model_validate_json(json.dumps(values).encode("utf-8")), args.messages)
+        binary_cpu = cpu_per_message(
+            lambda: Event.model_validate(EVENT_WIRE.decode(EVENT_WIRE.encode(values))), args.messages)
+
+        print(f"{size:>4} {len(json_body):>9} {len(binary_body):>8} {json_cpu:>10.2f} {binary_cpu:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Métricas dos nós: contadores, gauges e histogramas de latência expostos em /metrics.
+
+Cada app cria o seu próprio Registry (o que permite carregar várias cópias do
+mesmo app no mesmo processo, como nos benchmarks) e registra as métricas das
+etapas críticas do algoritmo. Uma métrica é identificada pelo nome e pelos
+rótulos, no estilo do Prometheus:
+
+    metrics = Registry()
+    delivered = metrics.counter("events_delivered_total", "Eventos entregues")
+    wait = metrics.histogram("delivery_delay_seconds", "Tempo no buffer", stage="causal")
+    data_lock = metrics.lock("data_lock")   # mede a espera nas aquisições disputadas
+
+GET /metrics devolve o formato texto do Prometheus; com ?format=json devolve um
+resumo com contagem, soma, máximo e percentis estimados pelos buckets.
+
+A saída no console dos apps passa por log(), que pode ser desligada com a
+variável de ambiente CONSOLE_LOG=0 para medir o sistema sem o custo dos prints.
+"""
+import bisect
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi.responses import PlainTextResponse
+
+# Saída no console dos apps (CONSOLE_LOG=0 desliga)
+CONSOLE_LOG = os.getenv("CONSOLE_LOG", "1").lower() not in ("0", "false", "off", "no")
+
+# Limites superiores (em segundos) dos buckets dos histogramas de latência
+DEFAULT_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def log(*args, **kwargs):
+    """print() que respeita CONSOLE_LOG."""
+    if CONSOLE_LOG:
+        print(*args, **kwargs)
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Percentil exato de uma amostra pelo método do vizinho mais próximo (nearest-rank)."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    """Contador monotônico, incrementado com inc() ou lido de uma função a cada coleta."""
+
+    kind = "counter"
+
+    def __init__(self, fn: Optional[Callable[[], float]] = None):
+        self._lock = threading.Lock()
+        self.fn = fn
+        self._value = 0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self.fn() if self.fn else self._value
+
+    def samples(self, name: str, labels: Labels) -> List[str]:
+        return [f"{name}{_format_labels(labels)} {self.value}"]
+
+    def summary(self):
+        return self.value
+
+
+class Gauge:
+    """Valor instantâneo, definido com set() ou lido de uma função a cada coleta."""
+
+    kind = "gauge"
+
+    def __init__(self, fn: Optional[Callable[[], float]] = None):
+        self.fn = fn
+        self._value = 0
+
+    def set(self, value: float):
+        self._value = value
+
+    @property
+    def value(self) -> float:
+        return self.fn() if self.fn else self._value
+
+    def samples(self, name: str, labels: Labels) -> List[str]:
+        return [f"{name}{_format_labels(labels)} {self.value}"]
+
+    def summary(self):
+        return self.value
+
+
+class Histogram:
+    """Histograma de durações (em segundos) com buckets fixos."""
+
+    kind = "histogram"
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # o último é o bucket +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Estimativa do percentil: limite superior do bucket que contém a posição."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(pct / 100 * self.count))
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def samples(self, name: str, labels: Labels) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', repr(bound)))} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {self.count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{_format_labels(labels)} {self.count}")
+        return lines
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else None,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+        }
+
+
+class TimedLock:
+    """
+    threading.Lock que registra em um histograma quanto tempo cada aquisição
+    disputada esperou. Pode substituir diretamente o Lock em blocos `with`.
+    """
+
+    def __init__(self, histogram: Histogram):
+        self._lock = threading.Lock()
+        self.wait = histogram
+        # Total de aquisições; só é alterado por quem acabou de adquirir o lock
+        self.acquisitions = 0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        # Caminho rápido: sem disputa, nada é registrado no histograma (que tem lock
+        # próprio) e o relógio não é lido; só a contagem, já protegida por este lock
+        if self._lock.acquire(False):
+            self.acquisitions += 1
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self._lock.acquire(True, timeout)
+        if acquired:
+            self.acquisitions += 1
+            self.wait.observe(time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Registry:
+    """Conjunto de métricas de um nó."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, str] = {}
+        self._metrics: Dict[str, Dict[Labels, object]] = {}
+
+    def _get(self, factory, name: str, help: str, labels: Dict[str, str]):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            family = self._metrics.setdefault(name, {})
+            self._help.setdefault(name, help)
+            if key not in family:
+                family[key] = factory()
+            return family[key]
+
+    def counter(self, name: str, help: str = "", fn: Optional[Callable[[], float]] = None, **labels) -> Counter:
+        return self._get(lambda: Counter(fn), name, help, labels)
+
+    def gauge(self, name: str, help: str = "", fn: Optional[Callable[[], float]] = None, **labels) -> Gauge:
+        return self._get(lambda: Gauge(fn), name, help, labels)
+
+    def histogram(self, name: str, help: str = "", buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+                  **labels) -> Histogram:
+        return self._get(lambda: Histogram(buckets), name, help, labels)
+
+    def lock(self, lock_name: str, **labels) -> TimedLock:
+        """
+        Cria um lock cuja espera nas aquisições disputadas é registrada em
+        lock_wait_seconds{lock=lock_name}; o total de aquisições fica em
+        lock_acquisitions_total, o que permite calcular a fração disputada.
+        """
+        histogram = self.histogram("lock_wait_seconds", "Tempo de espera nas aquisições disputadas do lock",
+                                   lock=lock_name, **labels)
+        lock = TimedLock(histogram)
+        self.counter("lock_acquisitions_total", "Aquisições do lock", fn=lambda: lock.acquisitions,
+                     lock=lock_name, **labels)
+        return lock
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            families = [(name, dict(family)) for name, family in self._metrics.items()]
+        for name, family in families:
+            kind = next(iter(family.values())).kind
+            lines.append(f"# HELP {name} {self._help.get(name, '')}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in family.items():
+                lines.extend(metric.samples(name, labels))
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """Resumo em JSON: {nome: [{"labels": {...}, "value" ou estatísticas}, ...]}."""
+        with self._lock:
+            families = [(name, dict(family)) for name, family in self._metrics.items()]
+        result = {}
+        for name, family in families:
+            entries = []
+            for labels, metric in family.items():
+                summary = metric.summary()
+                entry = {"labels": dict(labels)}
+                if isinstance(summary, dict):
+                    entry.update(summary)
+                else:
+                    entry["value"] = summary
+                entries.append(entry)
+            result[name] = entries
+        return result
+
+    def response(self, format: str = "prometheus"):
+        """Resposta do endpoint /metrics no formato pedido ("prometheus" ou "json")."""
+        if format == "json":
+            return self.snapshot()
+        return PlainTextResponse(self.render_prometheus(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,144 @@
+"""
+Transporte HTTP compartilhado para as chamadas entre nós.
+
+Cada chamada a requests.post/requests.get abre e fecha uma conexão TCP. O
+Transport mantém uma sessão com um pool de conexões keep-alive por destino
+(host:porta), de modo que mensagens para o mesmo nó reutilizam conexões já
+abertas. Oferece envio síncrono (post/get) e assíncrono (post_async), este
+último executado em um pool de threads compartilhado em vez de uma thread
+nova por mensagem. Envios com atraso aguardam em uma única thread de
+agendamento, que os passa ao pool quando vencem.
+
+Configuração por variáveis de ambiente:
+    TRANSPORT_TIMEOUT   timeout padrão em segundos (5)
+    TRANSPORT_RETRIES   novas tentativas de conexão (0); só repete quando a
+                        conexão falha, então a mensagem nunca é enviada duas vezes
+    TRANSPORT_POOL_SIZE conexões mantidas por destino (10)
+    TRANSPORT_WORKERS   threads para envios assíncronos (16)
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.retry import Retry
+
+
+def connection_refused(exc: Exception) -> bool:
+    """
+    O destino recusou a conexão (ou seu nome não resolve): o processo está fora do
+    ar e nada foi enviado. Um timeout ao conectar não entra aqui, pois o destino
+    pode estar vivo e apenas inacessível (ex.: partição de rede).
+    """
+    if not isinstance(exc, requests.ConnectionError) or not exc.args:
+        return False
+    return isinstance(getattr(exc.args[0], "reason", None), NewConnectionError)
+
+
+def not_delivered(exc: Exception) -> bool:
+    """
+    A requisição certamente não chegou ao destino: conexão recusada ou timeout ao
+    conectar. Outras falhas (timeout de leitura, conexão reiniciada em um socket
+    keep-alive reutilizado) podem ocorrer depois de o corpo ter sido enviado.
+    """
+    return isinstance(exc, requests.ConnectTimeout) or connection_refused(exc)
+
+
+class Transport:
+    def __init__(self, timeout: Optional[float] = None, retries: Optional[int] = None,
+                 pool_size: Optional[int] = None, workers: Optional[int] = None):
+        self.timeout = timeout if timeout is not None else float(os.getenv("TRANSPORT_TIMEOUT", "5"))
+        retries = retries if retries is not None else int(os.getenv("TRANSPORT_RETRIES", "0"))
+        pool_size = pool_size if pool_size is not None else int(os.getenv("TRANSPORT_POOL_SIZE", "10"))
+        workers = workers if workers is not None else int(os.getenv("TRANSPORT_WORKERS", "16"))
+
+        retry = Retry(total=retries, connect=retries, read=0, status=0, other=0,
+                      backoff_factor=0.05, allowed_methods=None, raise_on_status=False)
+        # O PoolManager do adapter mantém um pool separado para cada destino
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transport")
+        # Envios atrasados: heap de (instante, sequência, envio, Future), consumido por
+        # uma única thread de agendamento iniciada no primeiro envio com atraso
+        self.delayed = []
+        self.delayed_sequence = itertools.count()
+        self.delayed_ready = threading.Condition()
+        self.scheduler: Optional[threading.Thread] = None
+        self.closed = False
+
+    def post(self, url: str, json=None, data: Optional[bytes] = None,
+             headers: Optional[dict] = None, timeout: Optional[float] = None) -> requests.Response:
+        """POST síncrono. Falhas de rede levantam requests.RequestException, como no requests."""
+        return self.session.post(url, json=json, data=data, headers=headers,
+                                 timeout=timeout if timeout is not None else self.timeout)
+
+    def get(self, url: str, timeout: Optional[float] = None) -> requests.Response:
+        """GET síncrono."""
+        return self.session.get(url, timeout=timeout if timeout is not None else self.timeout)
+
+    def post_async(self, url: str, json=None, data: Optional[bytes] = None,
+                   headers: Optional[dict] = None, timeout: Optional[float] = None,
+                   delay: float = 0.0) -> Future:
+        """
+        POST assíncrono, opcionalmente após `delay` segundos (latência simulada).
+        Retorna um Future com a resposta ou a exceção do envio.
+        """
+        def send():
+            return self.post(url, json=json, data=data, headers=headers, timeout=timeout)
+
+        if not delay:
+            return self.executor.submit(send)
+
+        # O atraso corre na thread de agendamento, sem ocupar uma thread do pool:
+        # envios atrasados não enfileiram os demais atrás de suas esperas
+        result: Future = Future()
+        with self.delayed_ready:
+            if self.closed:
+                raise RuntimeError("Transport encerrado")
+            heapq.heappush(self.delayed, (time.monotonic() + delay, next(self.delayed_sequence), send, result))
+            if self.scheduler is None:
+                self.scheduler = threading.Thread(target=self.run_delayed, name="transport-delay", daemon=True)
+                self.scheduler.start()
+            self.delayed_ready.notify()
+        return result
+
+    def run_delayed(self):
+        """Laço da thread de agendamento: passa ao pool cada envio atrasado quando ele vence."""
+        while True:
+            with self.delayed_ready:
+                while not self.closed and (not self.delayed or self.delayed[0][0] > time.monotonic()):
+                    self.delayed_ready.wait(self.delayed[0][0] - time.monotonic() if self.delayed else None)
+                if self.closed:
+                    pending, self.delayed = self.delayed, []
+                    break
+                _, _, send, result = heapq.heappop(self.delayed)
+            try:
+                self.executor.submit(send).add_done_callback(lambda sent, result=result: _copy_result(sent, result))
+            except RuntimeError as e:
+                # Transport encerrado (close) durante o atraso
+                result.set_exception(e)
+        for _, _, _, result in pending:
+            result.set_exception(RuntimeError("Transport encerrado antes do envio"))
+
+    def close(self):
+        with self.delayed_ready:
+            self.closed = True
+            self.delayed_ready.notify()
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+def _copy_result(source: Future, target: Future):
+    """Repassa o resultado (ou a exceção) de um Future para outro."""
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
@@ -0,0 +1,136 @@
+"""
+Formato binário compacto para as mensagens entre nós.
+
+As mensagens trocadas entre réplicas (Event, Message, Ack) normalmente viajam
+como JSON. Para reduzir o tamanho do tráfego interno, este módulo oferece uma
+codificação binária baseada em struct, descrita por um WireSchema (lista
+ordenada de campos e tipos):
+
+    int       inteiro com sinal de 64 bits
+    opt_int   int opcional (None é marcado no cabeçalho)
+    str       UTF-8 com tamanho (uint32) à frente
+    opt_str   str opcional
+    int_list  lista de inteiros não negativos (ex.: relógio vetorial),
+              empacotada como uint16 de tamanho + uint32 por posição
+
+O formato é negociado pelo Content-Type: quem recebe com CONTENT_TYPE decodifica
+os campos e os valida com o modelo; requisições JSON (clientes externos)
+continuam aceitas. O ganho é de tamanho, não de CPU: com o pydantic 2 a
+validação de JSON roda em Rust e costuma ser mais barata que decodificar em
+Python (ver common/bench_wire.py).
+
+O formato usado no envio é escolhido pela variável de ambiente WIRE_FORMAT
+("json", padrão, ou "binary").
+"""
+import os
+import struct
+from typing import Any, Dict, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+CONTENT_TYPE = "application/x-node-binary"
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "json")
+VERSION = 1
+
+_HEADER = struct.Struct("<BI")  # versão, máscara de campos None
+_INT = struct.Struct("<q")
+_LEN = struct.Struct("<I")
+_COUNT = struct.Struct("<H")
+
+KINDS = ("int", "opt_int", "str", "opt_str", "int_list")
+
+
+class WireSchema:
+    """Layout binário de um modelo: campos em ordem fixa com seus tipos."""
+
+    def __init__(self, *fields: Tuple[str, str]):
+        for name, kind in fields:
+            if kind not in KINDS:
+                raise ValueError(f"Tipo desconhecido para o campo {name}: {kind}")
+        if len(fields) > 32:
+            raise ValueError("Um WireSchema suporta no máximo 32 campos")
+        self.fields = fields
+
+    def encode(self, values: Dict[str, Any]) -> bytes:
+        none_mask = 0
+        parts = []
+        for index, (name, kind) in enumerate(self.fields):
+            value = values.get(name)
+            if value is None:
+                if not kind.startswith("opt_"):
+                    raise ValueError(f"Campo obrigatório ausente: {name}")
+                none_mask |= 1 << index
+                continue
+            if kind in ("int", "opt_int"):
+                parts.append(_INT.pack(value))
+            elif kind in ("str", "opt_str"):
+                encoded = value.encode("utf-8")
+                parts.append(_LEN.pack(len(encoded)))
+                parts.append(encoded)
+            else:
+                parts.append(_COUNT.pack(len(value)))
+                parts.append(struct.pack(f"<{len(value)}I", *value))
+        return _HEADER.pack(VERSION, none_mask) + b"".join(parts)
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        version, none_mask = _HEADER.unpack_from(data, 0)
+        if version != VERSION:
+            raise ValueError(f"Versão do formato binário não suportada: {version}")
+        offset = _HEADER.size
+        values = {}
+        for index, (name, kind) in enumerate(self.fields):
+            if none_mask & (1 << index):
+                values[name] = None
+            elif kind in ("int", "opt_int"):
+                values[name] = _INT.unpack_from(data, offset)[0]
+                offset += _INT.size
+            elif kind in ("str", "opt_str"):
+                size = _LEN.unpack_from(data, offset)[0]
+                offset += _LEN.size
+                values[name] = data[offset:offset + size].decode("utf-8")
+                offset += size
+            else:
+                count = _COUNT.unpack_from(data, offset)[0]
+                offset += _COUNT.size
+                values[name] = list(struct.unpack_from(f"<{count}I", data, offset))
+                offset += 4 * count
+        if offset != len(data):
+            raise ValueError("Bytes excedentes na mensagem binária")
+        return values
+
+
+def encode_body(schema: WireSchema, values: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Argumentos de Transport.post/post_async para enviar `values` no formato
+    configurado em WIRE_FORMAT.
+    """
+    if WIRE_FORMAT == "binary":
+        return {"data": schema.encode(values), "headers": {"Content-Type": CONTENT_TYPE}}
+    return {"json": values}
+
+
+def body_parser(model: type, schema: WireSchema):
+    """
+    Dependência do FastAPI que lê o corpo como `model`, em binário ou JSON;
+    nos dois casos os campos são validados pelo pydantic.
+    """
+
+    async def parse(request: Request) -> BaseModel:
+        body = await request.body()
+        if request.headers.get("content-type", "").startswith(CONTENT_TYPE):
+            try:
+                values = schema.decode(body)
+            except (ValueError, struct.error) as e:
+                raise HTTPException(status_code=400, detail=f"Mensagem binária inválida: {e}")
+            try:
+                return model.model_validate(values)
+            except ValidationError as e:
+                raise RequestValidationError(e.errors(include_url=False))
+        try:
+            return model.model_validate_json(body)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False))
+
+    return parse
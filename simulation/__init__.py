@@ -0,0 +1 @@
+"""Simulador determinístico, em um único processo, dos cinco algoritmos."""
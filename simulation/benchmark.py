@@ -0,0 +1,100 @@
+"""
+Benchmark dos cinco algoritmos sobre o simulador determinístico.
+
+Para cada algoritmo e tamanho de cluster, roda a carga de trabalho do cluster
+(ver simulation/clusters.py) sobre a rede virtual e reporta:
+
+  - operações concluídas / submetidas;
+  - vazão (operações concluídas por segundo virtual);
+  - latência das operações em percentis (p50, p90, p99);
+  - mensagens por operação;
+  - indicadores de correção do algoritmo (ex.: ordem divergente, violações de exclusão).
+
+Os tempos são virtuais: não dependem da máquina e, com a mesma semente, os
+números se repetem exatamente, o que permite comparar versões do código.
+
+Uso (a partir da raiz do repositório):
+    python -m simulation.benchmark --algorithms causal total-order token-ring --sizes 3 5 8
+    python -m simulation.benchmark --algorithms bully --sizes 3 5 --ops 5 --healthcheck-interval 1 --lease 3
+"""
+import argparse
+import time
+
+from common.metrics import percentile
+from simulation.clusters import CLUSTERS
+
+
+def format_extras(extras: dict) -> str:
+    return " ".join(f"{key}={value}" for key, value in extras.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos algoritmos no simulador determinístico")
+    parser.add_argument("--algorithms", nargs="+", default=list(CLUSTERS), choices=list(CLUSTERS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 5, 8], help="Tamanhos de cluster")
+    parser.add_argument("--ops", type=int, default=100, help="Operações por execução")
+    parser.add_argument("--rate", type=float, default=20.0, help="Chegadas de operações por segundo (Poisson)")
+    parser.add_argument("--drain", type=float, default=120.0,
+                        help="Tempo máximo (s virtuais) após a última chegada para as operações concluírem")
+    parser.add_argument("--latency", type=float, default=0.002, help="Latência de ida da rede (s)")
+    parser.add_argument("--jitter", type=float, default=0.001, help="Variação máxima da latência (s)")
+    parser.add_argument("--loss", type=float, default=0.0, help="Probabilidade de perda de cada mensagem")
+    parser.add_argument("--reorder", type=float, default=0.0,
+                        help="Probabilidade de uma mensagem sofrer atraso extra e ser reordenada")
+    parser.add_argument("--reorder-delay", type=float, default=0.05, help="Atraso extra máximo na reordenação (s)")
+    parser.add_argument("--crash", type=int, default=0, help="Nós derrubados durante a execução")
+    parser.add_argument("--crash-at", type=float, default=None,
+                        help="Instante virtual das quedas (padrão: meio da janela de chegadas)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--token-mode", choices=["ring", "demand"], default=None, help="TOKEN_MODE do Token Ring")
+    parser.add_argument("--hold", type=float, default=0.01, help="Tempo de posse da SC no Token Ring (s)")
+    parser.add_argument("--delivery-interval", type=float, default=None,
+                        help="DELIVERY_INTERVAL do Multicast com Ordenação Total (s)")
+    parser.add_argument("--healthcheck-interval", type=float, default=None, help="HEALTHCHECK_INTERVAL do Bully (s)")
+    parser.add_argument("--lease", type=float, default=None, help="LEASE_DURATION do Bully (s)")
+    parser.add_argument("--demo-delays", action="store_true",
+                        help="Mantém o atraso artificial de envio do nó 0 das consistências causal e eventual")
+    parser.add_argument("--verbose", action="store_true", help="Mantém a saída dos apps no console")
+    args = parser.parse_args()
+
+    print(f"semente={args.seed} latência={args.latency}s variação={args.jitter}s perda={args.loss} "
+          f"reordenação={args.reorder} quedas={args.crash}")
+    for name in args.algorithms:
+        print(f"\n== {name} ==")
+        print(f"{'N':>3} {'ok':>9} {'ops/s':>8} {'p50 (ms)':>9} {'p90 (ms)':>9} {'p99 (ms)':>9} "
+              f"{'msgs/op':>8} {'t virt (s)':>10} {'t real (s)':>10}  extras")
+        for size in args.sizes:
+            cluster = CLUSTERS[name](
+                size,
+                seed=args.seed * 100003 + size,
+                latency=args.latency,
+                jitter=args.jitter,
+                loss=args.loss,
+                reorder=args.reorder,
+                reorder_delay=args.reorder_delay,
+                honor_send_delay=args.demo_delays,
+                verbose=args.verbose,
+                token_mode=args.token_mode,
+                hold=args.hold,
+                delivery_interval=args.delivery_interval,
+                healthcheck_interval=args.healthcheck_interval,
+                lease=args.lease,
+            )
+            wall_start = time.perf_counter()
+            result = cluster.run_workload(args.ops, args.rate, args.drain, crashes=args.crash, crash_at=args.crash_at)
+            wall = time.perf_counter() - wall_start
+
+            ok = f"{result['completed']}/{result['operations']}"
+            if not result["latencies"]:
+                print(f"{size:>3} {ok:>9} nenhuma operação concluída  {format_extras(result['extras'])}")
+                continue
+            latencies = [latency * 1000 for latency in result["latencies"]]
+            throughput = f"{result['throughput']:.1f}" if result["throughput"] else "-"
+            per_operation = result["messages"] / max(1, result["completed"])
+            print(f"{size:>3} {ok:>9} {throughput:>8} "
+                  f"{percentile(latencies, 50):>9.1f} {percentile(latencies, 90):>9.1f} {percentile(latencies, 99):>9.1f} "
+                  f"{per_operation:>8.1f} {result['virtual_time']:>10.1f} {wall:>10.2f}  {format_extras(result['extras'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,509 @@
+"""
+Clusters simulados de cada algoritmo e suas cargas de trabalho.
+
+Cada classe carrega N cópias do app.py do algoritmo, configura os IDs e a
+lista de processos de cada cópia, agenda as funções de um passo que no app
+real rodam em threads de background e define o que é uma "operação":
+
+    causal / eventual   um post (ou reply) criado em uma réplica; concluído
+                        quando foi entregue em todas as réplicas ativas
+    total-order         uma mensagem externa recebida por um processo; concluída
+                        quando foi entregue (DELIVERED) em todos os processos ativos
+    token-ring          um pedido de SC; concluído quando a SC é concedida
+    bully               um failover: o líder cai e a operação termina quando
+                        todos os processos ativos reconhecem o novo líder
+"""
+import abc
+import itertools
+import os
+from typing import Dict, List, Optional
+
+from simulation.core import Scheduler, SimEvent, SimNode, VirtualNetwork, load_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Cluster(abc.ABC):
+    """Base dos clusters: N cópias do app sobre a mesma rede e o mesmo relógio virtuais."""
+
+    name = ""
+    app_dir = ""
+    # Caminhos cujas respostas são usadas pelo remetente (ver simulation/core.py)
+    rpc_paths = ()
+
+    def __init__(self, size: int, seed: int = 0, latency: float = 0.002, jitter: float = 0.0,
+                 loss: float = 0.0, reorder: float = 0.0, reorder_delay: float = 0.05,
+                 honor_send_delay: bool = False, verbose: bool = False, **options):
+        self.size = size
+        self.options = options
+        self.verbose = verbose
+        self.scheduler = Scheduler(seed)
+        self.network = VirtualNetwork(self.scheduler, latency, jitter, loss, reorder, reorder_delay,
+                                      self.rpc_paths, honor_send_delay)
+        self.loads = itertools.count()
+        self.nodes: List[SimNode] = [self.create_node(index) for index in range(size)]
+
+    # --- Nós ---
+
+    def host(self, index: int) -> str:
+        return f"app-{index + 1}:8000"
+
+    def create_node(self, index: int) -> SimNode:
+        node = load_app(os.path.join(ROOT, self.app_dir, "app.py"),
+                        f"sim_{self.name.replace('-', '_')}_{id(self)}_{next(self.loads)}",
+                        self.scheduler, self.network, self.host(index), index, self.verbose)
+        self.configure(node)
+        return node
+
+    def configure(self, node: SimNode):
+        """Ajusta o estado global do app para o papel do nó no cluster."""
+
+    def alive_nodes(self) -> List[SimNode]:
+        return [node for node in self.nodes if node.alive]
+
+    def crash(self, node: SimNode):
+        node.alive = False
+
+    # --- Carga de trabalho ---
+
+    def start(self):
+        """Agenda as tarefas periódicas dos nós (as threads de background do app)."""
+
+    def extra_stats(self) -> dict:
+        return {}
+
+    @abc.abstractmethod
+    def run_workload(self, operations: int, rate: float, drain: float,
+                     crashes: int = 0, crash_at: Optional[float] = None, warmup: float = 1.0) -> dict:
+        """
+        Roda a carga de trabalho e retorna operations, completed, latencies,
+        throughput, messages, virtual_time e extras (ver simulation/benchmark.py).
+        """
+
+
+class OpenLoopCluster(Cluster):
+    """Carga aberta: operações com chegadas de Poisson em nós ativos sorteados."""
+
+    def __init__(self, size: int, **kwargs):
+        self.operation_ids = itertools.count(1)
+        # Instante de início de cada operação
+        self.submitted: Dict[str, float] = {}
+        super().__init__(size, **kwargs)
+
+    @abc.abstractmethod
+    def submit(self, node: SimNode):
+        """Inicia uma operação no nó."""
+
+    @abc.abstractmethod
+    def completion_times(self) -> Dict[str, float]:
+        """Instante de conclusão de cada operação concluída."""
+
+    def done(self) -> bool:
+        return len(self.completion_times()) == len(self.submitted)
+
+    def new_operation(self) -> str:
+        operation = f"op{next(self.operation_ids)}"
+        self.submitted[operation] = self.scheduler.now
+        return operation
+
+    def run_workload(self, operations: int, rate: float, drain: float,
+                     crashes: int = 0, crash_at: Optional[float] = None, warmup: float = 1.0) -> dict:
+        """
+        Submete `operations` operações com chegadas de Poisson (`rate` por segundo)
+        a nós ativos sorteados e roda até todas concluírem ou até `drain` segundos
+        após a última chegada. `crashes` nós sorteados caem no instante `crash_at`.
+        """
+        rnd = self.scheduler.random
+        self.start()
+        self.scheduler.run(until=warmup)
+
+        when = self.scheduler.now
+        for _ in range(operations):
+            when += rnd.expovariate(rate)
+            self.scheduler.at(when, self._submit_random)
+        last_arrival = when
+        if crashes:
+            crash_time = crash_at if crash_at is not None else (warmup + last_arrival) / 2
+            self.scheduler.at(crash_time, lambda: self._crash_random(crashes))
+
+        messages_before = self.network.messages_sent
+        start = self.scheduler.now
+        self.scheduler.run(until=last_arrival + drain, stop=lambda: self.scheduler.now >= last_arrival and self.done())
+
+        completions = self.completion_times()
+        latencies = [completions[op] - self.submitted[op] for op in completions]
+        elapsed = (max(completions.values()) - start) if completions else 0.0
+        return {
+            "operations": len(self.submitted),
+            "completed": len(completions),
+            "latencies": latencies,
+            "throughput": len(completions) / elapsed if elapsed > 0 else None,
+            "messages": self.network.messages_sent - messages_before,
+            "virtual_time": self.scheduler.now,
+            "extras": self.extra_stats(),
+        }
+
+    def _submit_random(self):
+        alive = self.alive_nodes()
+        if alive:
+            self.submit(self.scheduler.random.choice(alive))
+
+    def _crash_random(self, count: int):
+        alive = self.alive_nodes()
+        # Ao menos um nó continua ativo
+        for node in self.scheduler.random.sample(alive, min(count, len(alive) - 1)):
+            self.crash(node)
+
+
+class BroadcastCluster(OpenLoopCluster):
+    """Operações entregues a todas as réplicas: concluídas quando todas as ativas as entregaram."""
+
+    def __init__(self, size: int, **kwargs):
+        # Instante da entrega de cada operação em cada nó: {op: {índice do nó: instante}}
+        self.deliveries: Dict[str, Dict[int, float]] = {}
+        super().__init__(size, **kwargs)
+
+    def record_delivery(self, node: SimNode, operation: str):
+        self.deliveries.setdefault(operation, {}).setdefault(node.index, self.scheduler.now)
+
+    def completion_times(self) -> Dict[str, float]:
+        alive = [node.index for node in self.alive_nodes()]
+        completions = {}
+        for operation in self.submitted:
+            delivered = self.deliveries.get(operation, {})
+            if all(index in delivered for index in alive):
+                completions[operation] = max(delivered[index] for index in alive)
+        return completions
+
+
+class CausalCluster(BroadcastCluster):
+    """Consistência Causal: posts e replies com relógio vetorial."""
+
+    name = "causal"
+    app_dir = "Causal Consistency"
+    # Fração das operações que são replies a um post já visível na réplica de origem
+    reply_ratio = 0.5
+
+    def __init__(self, size: int, **kwargs):
+        self.posts: List[str] = []
+        self.parents: Dict[str, Optional[str]] = {}
+        self.replies_before_parent = 0
+        super().__init__(size, **kwargs)
+
+    def host(self, index: int) -> str:
+        return f"replica-{index}:8080"
+
+    def configure(self, node: SimNode):
+        module = node.module
+        module.processes = [self.host(index) for index in range(self.size)]
+        module.myProcessId = node.index
+        self.reset_clock(module)
+
+        deliver = module.processMsg
+
+        def process_and_record(msg):
+            deliver(msg)
+            parent = self.parents.get(msg.evtId)
+            if parent is not None and node.index not in self.deliveries.get(parent, {}):
+                self.replies_before_parent += 1
+            self.record_delivery(node, msg.evtId)
+
+        module.processMsg = process_and_record
+
+    def reset_clock(self, module):
+        module.vector_clock = [0] * self.size
+
+    def submit(self, node: SimNode):
+        operation = self.new_operation()
+        visible = [post for post in self.posts if node.index in self.deliveries.get(post, {})]
+        parent = None
+        if visible and self.scheduler.random.random() < self.reply_ratio:
+            parent = self.scheduler.random.choice(visible)
+        else:
+            self.posts.append(operation)
+        self.parents[operation] = parent
+        event = node.module.Event(processId=node.index, evtId=operation, parentEvtId=parent,
+                                  author=f"cliente-{node.index}", text=f"Mensagem {operation}")
+        node.module.post(event)
+
+    def extra_stats(self) -> dict:
+        return {"replies_antes_do_pai": self.replies_before_parent}
+
+
+class EventualCluster(CausalCluster):
+    """Consistência Eventual: mesma carga da causal, sem buffer (replies podem chegar antes do pai)."""
+
+    name = "eventual"
+    app_dir = "Eventual Consistency"
+
+    def reset_clock(self, module):
+        module.timestamp = 0
+
+
+class TotalOrderCluster(BroadcastCluster):
+    """Multicast com ordenação total (Lamport + ACKs)."""
+
+    name = "total-order"
+    app_dir = "Total Ordering Muticast"
+    # O app envia mensagens e ACKs com transport.post síncrono, e a correção depende
+    # disso: o ACK de um processo só sai depois que suas mensagens anteriores foram
+    # recebidas, como em canais FIFO
+    rpc_paths = ("/recieve_message", "/recieve_ack")
+
+    def __init__(self, size: int, **kwargs):
+        # Sequência de entregas de cada nó, para verificar a ordem total
+        self.sequences: Dict[int, List[str]] = {}
+        super().__init__(size, **kwargs)
+
+    def configure(self, node: SimNode):
+        module = node.module
+        module.process_id = node.index + 1
+        module.all_processes = [index + 1 for index in range(self.size)]
+        module.internal_clock = 5 * module.process_id
+        if self.options.get("delivery_interval"):
+            module.DELIVERY_INTERVAL = self.options["delivery_interval"]
+        self.sequences[node.index] = []
+
+    def start(self):
+        for node in self.nodes:
+            interval = node.module.DELIVERY_INTERVAL
+            # Fases diferentes, como threads iniciadas em momentos diferentes
+            self.scheduler.every(interval, lambda node=node: self.deliver(node), node,
+                                 first=self.scheduler.random.uniform(0, interval))
+
+    def deliver(self, node: SimNode):
+        message = node.module.deliver_next_message()
+        if message is not None:
+            self.sequences[node.index].append(message.data)
+            self.record_delivery(node, message.data)
+
+    def submit(self, node: SimNode):
+        operation = self.new_operation()
+        node.module.recieve_external_message(operation)
+
+    def extra_stats(self) -> dict:
+        """Processos cuja ordem de entrega diverge da do primeiro processo ativo."""
+        alive = [node.index for node in self.alive_nodes()]
+        common = {op for op, delivered in self.deliveries.items() if all(i in delivered for i in alive)}
+        reference = [op for op in self.sequences[alive[0]] if op in common]
+        divergent = sum(1 for i in alive[1:] if [op for op in self.sequences[i] if op in common] != reference)
+        return {"ordem_divergente": divergent}
+
+
+class TokenRingCluster(OpenLoopCluster):
+    """Token Ring (modo anel ou sob demanda) com pedidos de SC de duração fixa."""
+
+    name = "token-ring"
+    app_dir = "Token Ring for Resource Sharing"
+    rpc_paths = ("/status",)
+
+    def __init__(self, size: int, **kwargs):
+        self.granted: Dict[str, float] = {}
+        self.safety_violations = 0
+        # Maior número de processos vistos ao mesmo tempo na SC (amostrado continuamente)
+        self.max_holders = 0
+        # Passo da thread do token já agendado e repasse pendente, por (nó, recurso)
+        self.pending_steps = set()
+        self.pending_passes: Dict[tuple, object] = {}
+        super().__init__(size, **kwargs)
+
+    def configure(self, node: SimNode):
+        module = node.module
+        module.process_id = node.index + 1
+        module.all_processes = [index + 1 for index in range(self.size)]
+        module.TOKEN_MODE = self.options.get("token_mode") or module.TOKEN_MODE
+        module.TOKEN_TIMEOUT = 2 * self.size * module.IDLE_HOP_DELAY + 2
+        # Os recursos são recriados porque dependem de all_processes
+        module.resources = {name: module.ResourceState(name) for name in module.RESOURCES}
+        for res in module.resources.values():
+            res.token_event = SimEvent()
+            res.token_event.callbacks.append(lambda node=node, res=res: self.wake(node, res))
+
+    def wake(self, node: SimNode, res):
+        """token_event.set(): agenda uma rodada da thread do token (token_worker)."""
+        key = (node.index, res.name)
+        if key not in self.pending_steps:
+            self.pending_steps.add(key)
+            self.scheduler.after(0, lambda: self.step(node, res), node)
+
+    def step(self, node: SimNode, res):
+        key = (node.index, res.name)
+        self.pending_steps.discard(key)
+        res.token_event.clear()
+        # Um novo sinal interrompe a espera antes do repasse, como em token_worker
+        pending = self.pending_passes.pop(key, None)
+        if pending is not None:
+            pending.cancel()
+        delay = node.module.token_worker_step(res)
+        if delay is not None:
+            self.pending_passes[key] = self.scheduler.after(delay, lambda: node.module.pass_token(res), node)
+
+    def start_node(self, node: SimNode):
+        module = node.module
+        self.scheduler.every(1, lambda: [module.regenerate_token_if_lost(res)
+                                         for res in module.resources.values()], node)
+        self.scheduler.every(0.1, module.release_expired_leases, node)
+        self.scheduler.after(0, lambda: self.claim_initial_tokens(node), node)
+
+    def claim_initial_tokens(self, node: SimNode):
+        """Como initial_token_holder: tenta de novo a cada segundo até decidir todos os recursos."""
+        if not node.module.claim_initial_tokens():
+            self.scheduler.after(1, lambda: self.claim_initial_tokens(node), node)
+
+    def start(self):
+        for node in self.nodes:
+            self.start_node(node)
+        self.scheduler.every(self.options.get("hold", 0.01) / 2, self.sample_holders)
+
+    def restart(self, node: SimNode):
+        """Recoloca o processo no ar com estado zerado, como um pod reiniciado."""
+        self.crash(node)
+        for key in [key for key in self.pending_steps if key[0] == node.index]:
+            self.pending_steps.discard(key)
+        for key in [key for key in self.pending_passes if key[0] == node.index]:
+            self.pending_passes.pop(key)
+        fresh = self.create_node(node.index)
+        self.nodes[node.index] = fresh
+        self.start_node(fresh)
+        return fresh
+
+    def sample_holders(self):
+        for name in self.nodes[0].module.RESOURCES:
+            holders = sum(1 for n in self.alive_nodes() if n.module.resources[name].in_critical_section)
+            self.max_holders = max(self.max_holders, holders)
+
+    def submit(self, node: SimNode):
+        module = node.module
+        operation = self.new_operation()
+        res = module.resources[module.DEFAULT_RESOURCE]
+        waiter = module.enqueue_waiter(res, module.CS_LEASE_SECONDS)
+        waiter.granted.callbacks.append(lambda: self.on_grant(node, res, waiter, operation))
+
+    def on_grant(self, node: SimNode, res, waiter, operation: str):
+        self.granted[operation] = self.scheduler.now
+        holders = [n for n in self.alive_nodes() if n.module.resources[res.name].in_critical_section]
+        if len(holders) > 1:
+            self.safety_violations += 1
+        hold = self.options.get("hold", 0.01)
+        self.scheduler.after(hold, lambda: node.module.release_cs(resource=res.name, grant_id=waiter.grant_id), node)
+
+    def completion_times(self) -> Dict[str, float]:
+        return dict(self.granted)
+
+    def extra_stats(self) -> dict:
+        regenerated = sum(res.tokens_regenerated for node in self.nodes for res in node.module.resources.values())
+        return {"violações_de_exclusão": self.safety_violations, "máx_na_sc": self.max_holders,
+                "tokens_regenerados": regenerated}
+
+
+class BullyCluster(Cluster):
+    """Algoritmo do Valentão: cada operação derruba o líder e mede o failover."""
+
+    name = "bully"
+    app_dir = "Bully Algorithm for Leader Election"
+    # Todas as respostas (ou a falta delas) são usadas pelo remetente
+    rpc_paths = ("/election", "/coordinator", "/healthcheck")
+
+    def __init__(self, size: int, **kwargs):
+        self.duplicate_elections: List[int] = []
+        super().__init__(size, **kwargs)
+
+    def configure(self, node: SimNode):
+        module = node.module
+        module.process_id = node.index + 1
+        module.all_processes = [index + 1 for index in range(self.size)]
+        if self.options.get("healthcheck_interval"):
+            module.HEALTHCHECK_INTERVAL = self.options["healthcheck_interval"]
+        if self.options.get("lease"):
+            module.LEASE_DURATION = self.options["lease"]
+            module.LEASE_RENEW_INTERVAL = module.LEASE_DURATION / 3
+
+    def start_node(self, node: SimNode):
+        module = node.module
+        rnd = self.scheduler.random
+        self.scheduler.every(module.HEALTHCHECK_INTERVAL, module.check_leader_health_once, node,
+                             first=rnd.uniform(0, module.HEALTHCHECK_INTERVAL))
+        self.scheduler.every(module.LEASE_RENEW_INTERVAL, lambda: module.announce_leader(renewal=True), node,
+                             first=rnd.uniform(0, module.LEASE_RENEW_INTERVAL))
+        # Como no __main__ do app, o processo de maior ID se anuncia líder ao iniciar
+        if module.process_id == max(module.all_processes):
+            self.scheduler.after(0, module.announce_leader, node)
+
+    def start(self):
+        for node in self.nodes:
+            self.start_node(node)
+
+    def converged(self) -> bool:
+        alive = self.alive_nodes()
+        expected = max(node.module.process_id for node in alive)
+        return all(node.module.leader_id == expected and not node.module.is_election_happening for node in alive)
+
+    def restart(self, node: SimNode):
+        """Recoloca o processo no ar com estado zerado, como um pod reiniciado."""
+        fresh = self.create_node(node.index)
+        self.nodes[node.index] = fresh
+        self.start_node(fresh)
+
+    def failover(self, kill: int = 1, max_wait: float = 10.0) -> Optional[dict]:
+        """
+        Derruba os `kill` processos de maior ID e roda até os demais reconhecerem o
+        novo líder. Retorna a duração do failover, as mensagens enviadas e as eleições
+        duplicadas (além da primeira), ou None se não convergir em `max_wait` segundos.
+        """
+        # A queda ocorre em um instante sorteado dentro de um intervalo de verificação,
+        # para não ficar alinhada ao evento que encerrou a estabilização
+        interval = self.nodes[0].module.HEALTHCHECK_INTERVAL
+        self.scheduler.run(until=self.scheduler.now + self.scheduler.random.uniform(0, interval))
+
+        killed = self.nodes[-kill:]
+        live = self.nodes[:-kill]
+        start = self.scheduler.now
+        messages_before = self.network.messages_sent
+        elections_before = sum(node.module.elections_started for node in live)
+        for node in killed:
+            self.crash(node)
+        if not self.scheduler.run(until=start + max_wait, stop=self.converged, check_interval=0.002):
+            return None
+        elections = sum(node.module.elections_started for node in live) - elections_before
+        return {
+            "failover": self.scheduler.now - start,
+            "messages": self.network.messages_sent - messages_before,
+            "duplicate_elections": max(0, elections - 1),
+        }
+
+    def run_workload(self, operations: int, rate: float, drain: float,
+                     crashes: int = 0, crash_at: Optional[float] = None, warmup: float = 1.0) -> dict:
+        """Carga fechada: derruba o líder, mede o failover, reinicia o processo e repete."""
+        self.start()
+        self.scheduler.run(until=warmup + drain, stop=self.converged)
+
+        latencies = []
+        messages = 0
+        for _ in range(operations):
+            if not self.converged() or self.size < 2:
+                break
+            leader = self.nodes[-1]
+            result = self.failover(kill=1, max_wait=drain)
+            if result is None:
+                break
+            latencies.append(result["failover"])
+            messages += result["messages"]
+            self.duplicate_elections.append(result["duplicate_elections"])
+
+            # O processo volta e, por ter o maior ID, retoma a liderança (fora da medição)
+            self.restart(leader)
+            self.scheduler.run(until=self.scheduler.now + drain, stop=self.converged)
+
+        return {
+            "operations": operations,
+            "completed": len(latencies),
+            "latencies": latencies,
+            "throughput": None,
+            "messages": messages,
+            "virtual_time": self.scheduler.now,
+            "extras": {"eleições_duplicadas_máx": max(self.duplicate_elections, default=0)},
+        }
+
+
+CLUSTERS = {cls.name: cls for cls in (CausalCluster, EventualCluster, TotalOrderCluster,
+                                      TokenRingCluster, BullyCluster)}
@@ -0,0 +1,373 @@
+"""
+Núcleo do simulador: escalonador de eventos discretos, relógio virtual e rede virtual.
+
+Tudo roda em uma única thread. O escalonador mantém uma fila de eventos
+ordenada por (instante virtual, ordem de inserção) e um random.Random com
+semente, usado para todas as decisões aleatórias (latência, perda,
+reordenação). Com a mesma semente e os mesmos parâmetros, a execução é
+idêntica.
+
+Cada nó é uma cópia independente do app.py (carregada com importlib, com seu
+próprio estado global) em que:
+  - `transport` é trocado por um VirtualTransport, que entrega as mensagens
+    chamando diretamente os endpoints do nó de destino;
+  - `time` é trocado por um VirtualTime, ligado ao relógio do escalonador;
+  - `threading` é trocado por um SimThreading: Thread(...).start() agenda a
+    função como um evento e Event() não bloqueia (ver SimEvent).
+As threads de background dos apps não são iniciadas; os clusters (clusters.py)
+agendam diretamente as funções de um passo (ex.: check_leader_health_once).
+
+Mensagens podem ser:
+  - assíncronas (padrão): o envio retorna na hora e a entrega é agendada para
+    depois da latência sorteada. Perdas levantam requests.Timeout no remetente
+    e destinos fora do ar levantam requests.ConnectionError, como no loopback;
+  - síncronas (caminhos em `rpc_paths`): o endpoint de destino é executado
+    dentro da chamada e o relógio avança a latência de ida e volta. Usadas quando
+    o remetente depende da resposta (ex.: STALE no /coordinator do Bully).
+    Aproximação: enquanto uma chamada síncrona está em andamento, nenhum outro
+    evento é processado; eventos que venceram nesse intervalo rodam logo após.
+"""
+import copy
+import heapq
+import importlib.util
+import inspect
+import itertools
+import random
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from pydantic import BaseModel
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+# Instante (epoch) correspondente ao tempo virtual zero
+EPOCH = 1_700_000_000.0
+
+
+class Timer:
+    """Evento agendado; pode ser cancelado antes de executar."""
+
+    __slots__ = ("when", "callback", "owner", "cancelled")
+
+    def __init__(self, when: float, callback: Callable[[], None], owner):
+        self.when = when
+        self.callback = callback
+        self.owner = owner
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """Fila de eventos com relógio virtual e gerador aleatório com semente."""
+
+    def __init__(self, seed: int):
+        self.now = 0.0
+        self.random = random.Random(seed)
+        self._queue = []
+        self._sequence = itertools.count()
+        self.events_run = 0
+
+    def at(self, when: float, callback: Callable[[], None], owner=None) -> Timer:
+        """Agenda `callback` para o instante `when`. Eventos de nós inativos são descartados."""
+        timer = Timer(max(when, self.now), callback, owner)
+        heapq.heappush(self._queue, (timer.when, next(self._sequence), timer))
+        return timer
+
+    def after(self, delay: float, callback: Callable[[], None], owner=None) -> Timer:
+        return self.at(self.now + delay, callback, owner)
+
+    def every(self, interval: float, callback: Callable[[], None], owner=None,
+              first: Optional[float] = None) -> None:
+        """Executa `callback` periodicamente enquanto o dono estiver ativo."""
+        def tick():
+            callback()
+            self.after(interval, tick, owner)
+
+        self.after(interval if first is None else first, tick, owner)
+
+    def advance(self, seconds: float):
+        """Avança o relógio durante um evento (bloqueio síncrono do chamador)."""
+        self.now += max(0.0, seconds)
+
+    def run(self, until: float, stop: Optional[Callable[[], bool]] = None, check_interval: float = 0.5) -> bool:
+        """
+        Processa eventos até o instante `until`, ou até `stop()` retornar True
+        (verificado a cada `check_interval` segundos virtuais). Retorna True se
+        parou por `stop()`.
+        """
+        next_check = self.now + check_interval
+        while self._queue and self._queue[0][0] <= until:
+            when, _, timer = heapq.heappop(self._queue)
+            if timer.cancelled or (timer.owner is not None and not timer.owner.alive):
+                continue
+            # Eventos que venceram durante uma chamada síncrona rodam "atrasados"
+            self.now = max(self.now, when)
+            self.events_run += 1
+            timer.callback()
+            if stop is not None and self.now >= next_check:
+                next_check = self.now + check_interval
+                if stop():
+                    return True
+        if stop is not None and stop():
+            return True
+        self.now = max(self.now, until)
+        return False
+
+
+class VirtualTime:
+    """Substitui o módulo time dentro de um app: o relógio é o do escalonador."""
+
+    def __init__(self, scheduler: Scheduler):
+        self.scheduler = scheduler
+
+    def time(self) -> float:
+        return EPOCH + self.scheduler.now
+
+    def monotonic(self) -> float:
+        return self.scheduler.now
+
+    perf_counter = monotonic
+
+    def sleep(self, seconds: float):
+        self.scheduler.advance(seconds)
+
+
+class SimEvent:
+    """
+    threading.Event sem bloqueio. wait() apenas retorna o estado atual; quem
+    precisa reagir a set() registra uma função em `callbacks`.
+    """
+
+    def __init__(self):
+        self._flag = False
+        self.callbacks: List[Callable[[], None]] = []
+
+    def set(self):
+        self._flag = True
+        for callback in list(self.callbacks):
+            callback()
+
+    def clear(self):
+        self._flag = False
+
+    def is_set(self) -> bool:
+        return self._flag
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._flag
+
+
+class SimThread:
+    """threading.Thread cujo start() agenda a função alvo como um evento do nó."""
+
+    def __init__(self, scheduler: Scheduler, owner, target: Callable, args: Iterable = (),
+                 kwargs: Optional[dict] = None, daemon: Optional[bool] = None, name: Optional[str] = None):
+        self.scheduler = scheduler
+        self.owner = owner
+        self.target = target
+        self.args = tuple(args)
+        self.kwargs = kwargs or {}
+
+    def start(self):
+        self.scheduler.after(0, lambda: self.target(*self.args, **self.kwargs), self.owner)
+
+    def join(self, timeout: Optional[float] = None):
+        pass
+
+
+class SimThreading:
+    """Substitui o módulo threading dentro de um app."""
+
+    Lock = staticmethod(threading.Lock)
+    RLock = staticmethod(threading.RLock)
+
+    def __init__(self, scheduler: Scheduler, owner):
+        self.scheduler = scheduler
+        self.owner = owner
+
+    def Thread(self, target: Callable, args: Iterable = (), kwargs: Optional[dict] = None, **options) -> SimThread:
+        return SimThread(self.scheduler, self.owner, target, args, kwargs, **options)
+
+    def Event(self) -> SimEvent:
+        return SimEvent()
+
+
+class VirtualResponse:
+    """Resposta mínima compatível com o uso de requests.Response pelos apps."""
+
+    status_code = 200
+
+    def __init__(self, body):
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class SimNode:
+    """Um app carregado na simulação, acessível na rede pelo `host` (ex.: "app-1:8000")."""
+
+    def __init__(self, host: str, index: int, module):
+        self.host = host
+        self.index = index
+        self.module = module
+        self.alive = True
+        self.routes: Dict[tuple, Callable] = {}
+        for route in module.app.routes:
+            for method in getattr(route, "methods", ()):
+                self.routes[(method, route.path)] = route.endpoint
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body):
+        """Chama o endpoint como o FastAPI faria: modelos pydantic são validados a partir do corpo."""
+        endpoint = self.routes.get((method, path))
+        if endpoint is None:
+            raise requests.HTTPError(f"404: {method} {path} em {self.host}")
+        kwargs = {}
+        for name, param in inspect.signature(endpoint).parameters.items():
+            annotation = param.annotation
+            if name in query:
+                kwargs[name] = annotation(query[name]) if annotation in (int, float, str) else query[name]
+            elif isinstance(annotation, type) and issubclass(annotation, BaseModel):
+                kwargs[name] = annotation.model_validate(body)
+            elif body is not None:
+                kwargs[name] = body
+        return endpoint(**kwargs)
+
+
+class VirtualNetwork:
+    """
+    Rede entre os nós com latência, variação, perda e reordenação configuráveis.
+    `reorder` é a probabilidade de uma mensagem sofrer um atraso extra de até
+    `reorder_delay` segundos, ultrapassando mensagens enviadas depois dela.
+    """
+
+    def __init__(self, scheduler: Scheduler, latency: float = 0.002, jitter: float = 0.0,
+                 loss: float = 0.0, reorder: float = 0.0, reorder_delay: float = 0.05,
+                 rpc_paths: Iterable[str] = (), honor_send_delay: bool = False):
+        self.scheduler = scheduler
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.rpc_paths = frozenset(rpc_paths)
+        # O atraso artificial de post_async (demo das consistências) é ignorado por padrão
+        self.honor_send_delay = honor_send_delay
+        self.nodes: Dict[str, SimNode] = {}
+        self.messages_sent = 0
+        self.messages_lost = 0
+        self.messages_delivered = 0
+
+    def add(self, node: SimNode):
+        self.nodes[node.host] = node
+
+    def one_way_delay(self) -> float:
+        rnd = self.scheduler.random
+        delay = max(0.0, self.latency + rnd.uniform(-self.jitter, self.jitter))
+        if self.reorder and rnd.random() < self.reorder:
+            delay += rnd.uniform(0, self.reorder_delay)
+        return delay
+
+    def _resolve(self, sender: SimNode, url: str):
+        self.messages_sent += 1
+        parts = urlsplit(url)
+        target = self.nodes.get(parts.netloc)
+        if not sender.alive:
+            raise requests.ConnectionError(f"{sender.host} está inativo")
+        if target is None or not target.alive:
+            # Em loopback, um processo inativo recusa a conexão imediatamente. O erro
+            # tem a mesma estrutura do requests, para que connection_refused() o reconheça.
+            reason = NewConnectionError(None, f"Conexão recusada por {parts.netloc}")
+            raise requests.ConnectionError(MaxRetryError(None, url, reason))
+        return target, parts.path, dict(parse_qsl(parts.query))
+
+    def _lost(self) -> bool:
+        if self.loss and self.scheduler.random.random() < self.loss:
+            self.messages_lost += 1
+            return True
+        return False
+
+    def send(self, sender: SimNode, method: str, url: str, body=None, timeout: float = 5,
+             extra_delay: float = 0.0) -> VirtualResponse:
+        target, path, query = self._resolve(sender, url)
+        # Cópia: o destinatário nunca compartilha objetos com o remetente
+        body = copy.deepcopy(body)
+
+        if path in self.rpc_paths:
+            if self._lost():
+                self.scheduler.advance(timeout)
+                raise requests.Timeout(f"Mensagem para {target.host} perdida")
+            self.scheduler.advance(self.one_way_delay())
+            self.messages_delivered += 1
+            result = target.handle(method, path, query, body)
+            self.scheduler.advance(self.one_way_delay())
+            return VirtualResponse(result)
+
+        if self._lost():
+            raise requests.Timeout(f"Mensagem para {target.host} perdida")
+
+        def deliver():
+            self.messages_delivered += 1
+            target.handle(method, path, query, body)
+
+        self.scheduler.after(extra_delay + self.one_way_delay(), deliver, target)
+        return VirtualResponse({"status": "ACK"})
+
+
+class VirtualTransport:
+    """Substitui common.transport.Transport em um nó simulado."""
+
+    def __init__(self, network: VirtualNetwork, node: SimNode):
+        self.network = network
+        self.node = node
+
+    def post(self, url: str, json=None, data: Optional[bytes] = None,
+             headers: Optional[dict] = None, timeout: Optional[float] = None) -> VirtualResponse:
+        return self.network.send(self.node, "POST", url, json, timeout or 5)
+
+    def get(self, url: str, timeout: Optional[float] = None) -> VirtualResponse:
+        return self.network.send(self.node, "GET", url, None, timeout or 5)
+
+    def post_async(self, url: str, json=None, data: Optional[bytes] = None,
+                   headers: Optional[dict] = None, timeout: Optional[float] = None,
+                   delay: float = 0.0) -> Future:
+        future = Future()
+        extra = delay if self.network.honor_send_delay else 0.0
+        try:
+            future.set_result(self.network.send(self.node, "POST", url, json, timeout or 5, extra_delay=extra))
+        except requests.RequestException as e:
+            future.set_exception(e)
+        return future
+
+    def close(self):
+        pass
+
+
+def _json_body(schema, values: dict) -> dict:
+    """Na simulação as mensagens trafegam como objetos Python, sem codificação binária."""
+    return {"json": values}
+
+
+def load_app(path: str, module_name: str, scheduler: Scheduler, network: VirtualNetwork,
+             host: str, index: int, verbose: bool = False) -> SimNode:
+    """Carrega uma cópia independente de um app.py e a liga ao relógio e à rede virtuais."""
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    node = SimNode(host, index, module)
+    module.transport.close()
+    module.transport = VirtualTransport(network, node)
+    module.time = VirtualTime(scheduler)
+    module.threading = SimThreading(scheduler, node)
+    if hasattr(module, "encode_body"):
+        module.encode_body = _json_body
+    if not verbose:
+        module.log = lambda *args, **kwargs: None
+        module.CONSOLE_LOG = False
+    network.add(node)
+    return node
@@ -0,0 +1,73 @@
+"""
+Verificações de regressão sobre o simulador determinístico.
+
+Cada verificação monta um cenário pequeno com os clusters de
+simulation/clusters.py e confere um comportamento que já falhou antes.
+
+Uso (a partir da raiz do repositório):
+    python -m simulation.regressions
+"""
+import sys
+
+from simulation.clusters import TokenRingCluster
+
+
+def check_demand_holder_keeps_granting():
+    """
+    Modo sob demanda: sem outros processos na fila do token, o detentor continua
+    atendendo pedidos locais sequenciais além de MAX_GRANTS_PER_VISIT.
+    """
+    cluster = TokenRingCluster(3, token_mode="demand", hold=0.01)
+    cluster.start()
+    cluster.scheduler.run(until=1)
+    holder = cluster.nodes[0]
+    limit = holder.module.MAX_GRANTS_PER_VISIT
+
+    for attempt in range(1, 2 * limit + 2):
+        cluster.submit(holder)
+        cluster.scheduler.run(until=cluster.scheduler.now + 1)
+        granted = len(cluster.completion_times())
+        assert granted == attempt, f"pedido {attempt} não concedido (limite da visita: {limit})"
+
+
+def check_restarted_owner_does_not_duplicate_token():
+    """
+    O dono do token inicial reiniciado com o token já circulando não cria um
+    segundo token: com pedidos em todos os processos, nunca há mais de um na SC.
+    """
+    for token_mode in ("ring", "demand"):
+        for seed in range(20):
+            cluster = TokenRingCluster(3, seed=seed, token_mode=token_mode, hold=0.05)
+            cluster.start()
+            cluster.scheduler.run(until=5)
+            cluster.restart(cluster.nodes[0])
+            for node in cluster.nodes:
+                for _ in range(3):
+                    cluster.submit(node)
+            cluster.scheduler.run(until=30)
+            assert cluster.max_holders <= 1 and cluster.safety_violations == 0, (
+                f"{cluster.max_holders} processos na SC ao mesmo tempo (modo {token_mode}, semente {seed})")
+            assert cluster.done(), f"pedidos não atendidos após o reinício (modo {token_mode}, semente {seed})"
+
+
+CHECKS = [
+    check_demand_holder_keeps_granting,
+    check_restarted_owner_does_not_duplicate_token,
+]
+
+
+def main():
+    failures = 0
+    for check in CHECKS:
+        try:
+            check()
+        except AssertionError as e:
+            failures += 1
+            print(f"FALHOU {check.__name__}: {e}")
+        else:
+            print(f"ok     {check.__name__}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()